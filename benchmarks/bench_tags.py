@@ -0,0 +1,71 @@
+"""
+Compare the throughput of tag extraction with the original implementation.
+
+Usage: uv run python -m benchmarks.bench_tags [num_notes]
+"""
+
+import random
+import re
+import string
+import sys
+import time
+from typing import Callable
+
+from notetime.tags import extract_tags, extract_tags_batch
+
+
+def extract_tags_original(text: str) -> list[str]:
+    tag_pattern = r"@([a-zA-Z0-9_]+)"
+    tags: list[str] = re.findall(tag_pattern, text)
+    return [tag.lower() for tag in tags]
+
+
+def generate_notes(num_notes: int, seed: int = 0) -> list[str]:
+    rng = random.Random(seed)
+    tag_names = [f"Tag_{i}" for i in range(200)]
+    notes = []
+    for _ in range(num_notes):
+        words = []
+        for _ in range(rng.randint(50, 400)):
+            if rng.random() < 0.05:
+                words.append("@" + rng.choice(tag_names))
+            else:
+                length = rng.randint(2, 10)
+                words.append("".join(rng.choices(string.ascii_lowercase, k=length)))
+        notes.append(" ".join(words))
+    return notes
+
+
+def measure(name: str, fn: Callable[[], object], num_bytes: int) -> None:
+    start = time.perf_counter()
+    fn()
+    duration = time.perf_counter() - start
+    print(f"{name:<32} {duration:8.3f} s {num_bytes / duration / 1e6:10.1f} MB/s")
+
+
+if __name__ == "__main__":
+    num_notes = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    notes = generate_notes(num_notes)
+    num_bytes = sum(len(note.encode()) for note in notes)
+    print(f"{num_notes} notes, {num_bytes / 1e6:.1f} MB")
+
+    measure(
+        "original extract_tags",
+        lambda: [extract_tags_original(note) for note in notes],
+        num_bytes,
+    )
+    measure(
+        "extract_tags",
+        lambda: [extract_tags(note) for note in notes],
+        num_bytes,
+    )
+    measure(
+        "extract_tags_batch (serial)",
+        lambda: extract_tags_batch(notes, max_workers=1),
+        num_bytes,
+    )
+    measure(
+        "extract_tags_batch (processes)",
+        lambda: extract_tags_batch(notes, min_parallel_size=0),
+        num_bytes,
+    )
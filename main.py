@@ -1,14 +1,32 @@
-import sqlite3
-from pathlib import Path
+"""
+Create the databases of all notebooks, or bring existing ones up to date
+without losing any notes.
 
-from notetime.db import (
-    initialize_database,
-)
+Usage: uv run main.py [--reset]
+"""
+
+import argparse
+
+from notetime.db import PATH_TO_DB
+from notetime.startup import StartupReport, ensure_schemas
 
 if __name__ == "__main__":
-    path_to_db = Path.cwd() / "data" / "db.sqlite3"
-    path_to_db.unlink(missing_ok=True)
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--reset",
+        action="store_true",
+        help="delete all notes of the default notebook first",
+    )
+    args = parser.parse_args()
+
+    if args.reset:
+        # A write-ahead log left next to the database would otherwise be
+        # applied to the new one
+        for suffix in ["", "-wal", "-shm"]:
+            PATH_TO_DB.with_name(PATH_TO_DB.name + suffix).unlink(missing_ok=True)
 
-    con = sqlite3.connect(path_to_db)
-    cur = con.cursor()
-    initialize_database(con, cur)
+    report = StartupReport()
+    ensure_schemas(report)
+    for notebook, seconds in report.schema_seconds.items():
+        status = "updated" if notebook in report.upgraded_notebooks else "up to date"
+        print(f"{notebook}: {status} ({seconds:.3f} s)")
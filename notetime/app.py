@@ -1,3 +1,9 @@
+# Imported before anything else, so that the startup report includes all
+# imports of the app
+import notetime.started  # noqa: F401
+
+import logging
+import time
 from pathlib import Path
 from typing import Type
 
@@ -15,7 +21,10 @@ from newsflash.widgets import (
 from newsflash.widgets.widgets import Widget
 
 from notetime.db import (
+    DEFAULT_NOTEBOOK,
+    Note,
     get_db_connection,
+    list_notebooks,
     update_note,
     create_note,
     get_note_by_id,
@@ -23,22 +32,121 @@ from notetime.db import (
     get_all_notes,
     get_all_tags,
     get_notes_by_tags,
+    search_notes,
+    search_tags,
+    compute_related_notes,
+    get_related_notes,
+    get_note_titles,
+    get_cooccurring_tags,
+)
+from notetime.maintenance import get_maintenance_scheduler
+from notetime.notebooks import (
+    get_all_notes_in_notebooks,
+    get_notes_by_tags_in_notebooks,
+    search_notebooks,
+    search_tags_in_notebooks,
 )
+from notetime.startup import run_startup, start_warm_up
+from notetime.writer import WriteQueue, get_write_queue
 
 
-def get_default_note_text() -> str:
-    con, cur = get_db_connection()
+def get_default_note_text(notebook: str = DEFAULT_NOTEBOOK) -> str:
+    con, cur = get_db_connection(notebook)
     note = get_in_progress_note(cur)
     con.close()
     return note.text
 
 
+def get_notebook_write_queue(notebook: str) -> WriteQueue:
+    # Notebooks created while the app is running get their maintenance
+    # started on the first write
+    get_maintenance_scheduler(notebook)
+    return get_write_queue(notebook)
+
+
+def get_selected_notebooks(value: str) -> list[str]:
+    """
+    Notebooks selected by the value of a `NotebookInput`: a comma separated
+    list of notebook names, or "all" for every notebook. Names of notebooks
+    that do not exist, for example from an old link, are left out, and the
+    default notebook is selected if none remain.
+    """
+    notebooks = list_notebooks()
+    if value == "all":
+        return notebooks
+    return [notebook for notebook in value.split(",") if notebook in notebooks] or [
+        DEFAULT_NOTEBOOK
+    ]
+
+
+def get_notebook_query(notebooks: list[str]) -> str:
+    return "&".join(
+        f"notebook={notebook}" for notebook in notebooks if notebook != DEFAULT_NOTEBOOK
+    )
+
+
+class NotebookInput(Input):
+    id: str = "notebook-input"
+    type: str = "hidden"
+    value: str = DEFAULT_NOTEBOOK
+
+
 class NoteSearchInput(Input):
     id: str = "note-search-input"
     placeholder: str = "search..."
     value: str = ""
     autofocus: bool = True
 
+    def on_input(
+        self,
+        note_grid: "NoteGrid",
+        notebook_input: NotebookInput,
+    ) -> list[Widget]:
+        query = self.value or ""
+        notebooks = get_selected_notebooks(notebook_input.value or "")
+
+        if len(notebooks) > 1:
+            if query.strip():
+                # As for a single notebook below, but note ids are only
+                # unique within their notebook
+                notes = search_notebooks(query=query, notebooks=notebooks)
+                tags = search_tags_in_notebooks(
+                    query=query, notebooks=notebooks, limit=1
+                )
+                if len(tags) > 0:
+                    note_keys = {(note.notebook, note.id) for note in notes}
+                    notes += [
+                        note
+                        for note in get_notes_by_tags_in_notebooks(
+                            tag_names=[tags[0].name], notebooks=notebooks
+                        )
+                        if (note.notebook, note.id) not in note_keys
+                    ]
+            else:
+                notes = get_all_notes_in_notebooks(notebooks=notebooks)
+            note_grid.items = get_note_widgets(notes)
+            return [note_grid]
+
+        con, cur = get_db_connection(notebooks[0])
+        if query.strip():
+            # Notes with a matching title come first, followed by the notes
+            # with the closest matching tag
+            notes = search_notes(cur=cur, query=query)
+            tags = search_tags(cur=cur, query=query, limit=1)
+            if len(tags) > 0:
+                note_ids = {note.id for note in notes}
+                notes += [
+                    note
+                    for note in get_notes_by_tags(cur=cur, tag_names=[tags[0].name])
+                    if note.id not in note_ids
+                ]
+        else:
+            notes = get_all_notes(cur=cur)
+        con.close()
+
+        note_grid.items = get_note_widgets(notes, notebook=notebooks[0])
+        return [note_grid]
+
 
 class NoteIDInput(Input):
     id: str = "note-id-input"
@@ -55,13 +163,16 @@ class NoteTextArea(TextArea):
     def on_input(
         self,
         note_id_input: NoteIDInput,
+        notebook_input: NotebookInput,
         note_description: "NoteDescription",
     ) -> list[Widget]:
         assert self.value is not None
         note_id = int(note_id_input.value)
+        notebook = notebook_input.value or DEFAULT_NOTEBOOK
 
-        con, cur = get_db_connection()
+        con, cur = get_db_connection(notebook)
         current_note = get_note_by_id(cur, note_id=note_id)
+        con.close()
         assert current_note is not None
 
         text = self.value
@@ -76,13 +187,12 @@ class NoteTextArea(TextArea):
         current_note.text = text
         current_note.set_updated_at_now()
 
-        updated_note = update_note(
-            con=con,
-            cur=cur,
-            note=current_note,
+        updated_note = (
+            get_notebook_write_queue(notebook)
+            .submit(update_note, note=current_note)
+            .result()
         )
 
-        con.close()
         note_description.text = f"Editing note: {current_note.title} (id: {current_note.id}). Last updated at {updated_note.updated_at.strftime('%Y-%m-%d %H:%M:%S')}."
 
         if note_id == 1:
@@ -99,32 +209,34 @@ class SaveButton(Button):
         self,
         notifications: Notifications,
         note_id_input: NoteIDInput,
+        notebook_input: NotebookInput,
         note_textarea: NoteTextArea,
     ) -> list[Widget]:
         note_id = int(note_id_input.value)
-        con, cur = get_db_connection()
+        notebook = notebook_input.value or DEFAULT_NOTEBOOK
+        con, cur = get_db_connection(notebook)
 
         assert note_textarea.value is not None
 
         assert note_id == 1
         buffer_note = get_in_progress_note(cur=cur)
+        con.close()
 
         # Make sure the buffer note contains the current content
         # of the textarea element before saving
         assert note_textarea.value == buffer_note.get_full_text()
-        new_note = create_note(
-            con=con,
-            cur=cur,
-            text=note_textarea.value,
-        )
+
+        write_queue = get_notebook_write_queue(notebook)
+        new_note_future = write_queue.submit(create_note, text=note_textarea.value)
 
         buffer_note.title = ""
         buffer_note.text = ""
-        update_note(con=con, cur=cur, note=buffer_note)
+        buffer_note_future = write_queue.submit(update_note, note=buffer_note)
 
-        notifications.push(f"Created new note with ID {new_note.id}")
+        new_note = new_note_future.result()
+        buffer_note_future.result()
 
-        con.close()
+        notifications.push(f"Created new note with ID {new_note.id}")
 
         return [notifications]
 
@@ -136,22 +248,25 @@ class ClearButton(Button):
     def on_click(
         self,
         note_id_input: NoteIDInput,
+        notebook_input: NotebookInput,
         note_textarea: NoteTextArea,
         note_description: "NoteDescription",
         create_note: SaveButton,
     ) -> list[Widget]:
+        notebook = notebook_input.value or DEFAULT_NOTEBOOK
         note_id_input.value = "1"
         note_textarea.value = ""
         note_description.text = "Creating a new note. Press save to create."
         create_note.disabled = False
 
-        con, cur = get_db_connection()
+        con, cur = get_db_connection(notebook)
         note = get_in_progress_note(cur=cur)
+        con.close()
+
         note.title = ""
         note.text = ""
-        update_note(con=con, cur=cur, note=note)
+        get_notebook_write_queue(notebook).submit(update_note, note=note).result()
 
-        con.close()
         return [note_id_input, note_textarea, note_description, create_note]
 
 
@@ -164,10 +279,16 @@ class EditNoteButton(Button):
         self,
         note_textarea: NoteTextArea,
         note_id_input: NoteIDInput,
+        notebook_input: NotebookInput,
     ) -> list[Widget]:
-        note_id = self.id.replace("edit-note-", "").replace("-button", "")
-
-        con, cur = get_db_connection()
+        note_id = self.id.removeprefix("edit-note-").removesuffix("-button")
+        notebook = notebook_input.value or DEFAULT_NOTEBOOK
+        if "-" in note_id:
+            # Notes from several notebooks have their notebook in the id,
+            # after the note id, which never contains a "-"
+            note_id, notebook = note_id.split("-", 1)
+
+        con, cur = get_db_connection(notebook)
         note = get_note_by_id(cur=cur, note_id=int(note_id))
         con.close()
 
@@ -182,6 +303,7 @@ class EditNoteButton(Button):
 
 class NoteWidget(Widget):
     template: tuple[str, str] = ("templates", "note_widget.html")
+    url: str = "/"
     title: str = ""
     text: str = ""
     updated_at: str = ""
@@ -189,6 +311,7 @@ class NoteWidget(Widget):
 
     include_in_context: set[str] = {
         "id",
+        "url",
         "title",
         "text",
         "hx_include",
@@ -206,6 +329,34 @@ class NoteWidget(Widget):
         return super()._post_init()
 
 
+def get_note_url(note_id: int | None, notebook: str) -> str:
+    if notebook == DEFAULT_NOTEBOOK:
+        return f"/?note_id={note_id}"
+    return f"/?note_id={note_id}&notebook={notebook}"
+
+
+def get_note_widgets(
+    notes: list[Note],
+    notebook: str = DEFAULT_NOTEBOOK,
+) -> list[NoteWidget]:
+    """
+    Widgets for `notes` of `notebook`. Notes from a query over several
+    notebooks carry their own notebook, which is added to their widget id
+    after the note id because note ids are only unique within a notebook.
+    """
+    return [
+        NoteWidget(
+            id=str(note.id) if note.notebook is None else f"{note.id}-{note.notebook}",
+            url=get_note_url(note.id, note.notebook or notebook),
+            title=note.title,
+            text=note.text,
+            updated_at=note.updated_at.strftime("%Y-%m-%d %H:%M"),
+            created_at=note.created_at.strftime("%Y-%m-%d %H:%M"),
+        )
+        for note in notes
+    ]
+
+
 class NoteGrid(Grid[NoteWidget]):
     id: str = "note-grid"
     num_columns: int = 2
@@ -213,8 +364,21 @@ class NoteGrid(Grid[NoteWidget]):
 
     def _post_init(self) -> None:
         current_tags: list[str] = self.root_widget.query_params.get("tag", [])
+        notebooks = get_selected_notebooks(
+            ",".join(self.root_widget.query_params.get("notebook", []))
+        )
 
-        con, cur = get_db_connection()
+        if len(notebooks) > 1:
+            if len(current_tags) > 0:
+                all_notes = get_notes_by_tags_in_notebooks(
+                    tag_names=current_tags, notebooks=notebooks
+                )
+            else:
+                all_notes = get_all_notes_in_notebooks(notebooks=notebooks)
+            self.items = get_note_widgets(all_notes)
+            return super()._post_init()
+
+        con, cur = get_db_connection(notebooks[0])
         if len(current_tags) > 0:
             all_notes = get_notes_by_tags(cur=cur, tag_names=current_tags)
         else:
@@ -222,16 +386,7 @@ class NoteGrid(Grid[NoteWidget]):
 
         con.close()
 
-        self.items = [
-            NoteWidget(
-                id=str(note.id),
-                title=note.title,
-                text=note.text,
-                updated_at=note.updated_at.strftime("%Y-%m-%d %H:%M"),
-                created_at=note.created_at.strftime("%Y-%m-%d %H:%M"),
-            )
-            for note in all_notes
-        ]
+        self.items = get_note_widgets(all_notes, notebook=notebooks[0])
         return super()._post_init()
 
 
@@ -259,6 +414,10 @@ class TagList(List[TagButton]):
         super()._post_init()
 
         current_tags: list[str] = self.root_widget.query_params.get("tag", [])
+        selected_notebooks: list[str] = self.root_widget.query_params.get(
+            "notebook", []
+        )
+        notebook_query = get_notebook_query(selected_notebooks)
 
         def get_new_tag_list(tag_name: str) -> list[str]:
             if tag_name in current_tags:
@@ -267,28 +426,55 @@ class TagList(List[TagButton]):
                 return current_tags + [tag_name]
 
         def get_new_url(tag_name: str) -> str:
-            new_tags = get_new_tag_list(tag_name)
-            if len(new_tags) > 0:
-                return f"/notes?{'&'.join([f'tag={t}' for t in new_tags])}"
+            params = [f"tag={t}" for t in get_new_tag_list(tag_name)]
+            if notebook_query:
+                params.append(notebook_query)
+            if len(params) > 0:
+                return f"/notes?{'&'.join(params)}"
             else:
                 return "/notes"
 
-        con, cur = get_db_connection()
-        all_tags = get_all_tags(cur=cur)
-        con.close()
+        # Tags of several notebooks are combined by name
+        num_notes_by_name: dict[str, int] = {}
+        for notebook in get_selected_notebooks(",".join(selected_notebooks)):
+            con, cur = get_db_connection(notebook)
+            for tag in get_all_tags(cur=cur):
+                num_notes_by_name[tag.name] = (
+                    num_notes_by_name.get(tag.name, 0) + tag.num_notes
+                )
+            con.close()
 
         self.items = [
             TagButton(
-                id=f"tag-{tag.name}-button",
-                label=tag.name,
-                num_notes=tag.num_notes,
-                url=get_new_url(tag.name),
-                active=tag.name in current_tags,
+                id=f"tag-{name}-button",
+                label=name,
+                num_notes=num_notes,
+                url=get_new_url(name),
+                active=name in current_tags,
             )
-            for tag in all_tags
+            for name, num_notes in num_notes_by_name.items()
         ]
 
 
+class RelatedNoteButton(Widget):
+    template: tuple[str, str] = ("templates", "related_note_widget.html")
+    id: str = "related-note-button"
+    label: str = "Note"
+    url: str = "/"
+
+    include_in_context: set[str] = {"id", "label", "url"}
+
+
+class RelatedNoteList(List[RelatedNoteButton]):
+    id: str = "related-note-list"
+    item_type: Type[RelatedNoteButton] = RelatedNoteButton
+
+
+class SuggestedTagList(List[TagButton]):
+    id: str = "suggested-tag-list"
+    item_type: Type[TagButton] = TagButton
+
+
 class NewNotePage(Page):
     id: str = "new-note-page"
     path: str = "/"
@@ -296,11 +482,29 @@ class NewNotePage(Page):
     template: tuple[str, str] = ("templates", "new_note.html")
     children: list[Widget] = []
     note_id: int = 1
+    notebook: str = DEFAULT_NOTEBOOK
 
     def _post_init(self) -> None:
-        con, cur = get_db_connection()
+        # The notebook comes from the query string and may not exist
+        self.notebook = get_selected_notebooks(self.notebook)[0]
+        con, cur = get_db_connection(self.notebook)
         note = get_note_by_id(cur=cur, note_id=self.note_id)
         assert note is not None
+        assert note.id is not None
+        assert note.tags is not None
+
+        if note.id == 1:
+            # Related notes are not stored for the in-progress note
+            related_notes = get_note_titles(
+                cur=cur,
+                note_ids=[
+                    related_note_id
+                    for related_note_id, _ in compute_related_notes(cur, note.id)
+                ],
+            )
+        else:
+            related_notes = get_related_notes(cur=cur, note_id=note.id)
+        suggested_tags = get_cooccurring_tags(cur=cur, tag_names=note.tags)
         con.close()
 
         if self.note_id == 1:
@@ -308,12 +512,37 @@ class NewNotePage(Page):
         else:
             note_description: str = f"Editing note: {note.title} (id: {note.id}). Updates are saved automatically."
 
+        notebook_query = get_notebook_query([self.notebook])
         self.children = [
             NoteIDInput(value=str(self.note_id)),
+            NotebookInput(value=self.notebook),
             NoteDescription(text=note_description),
             NoteTextArea(value=note.get_full_text()),
             SaveButton(disabled=note.id != 1),
             ClearButton(),
+            RelatedNoteList(
+                items=[
+                    RelatedNoteButton(
+                        id=f"related-note-{related_note.id}-button",
+                        label=related_note.title,
+                        url=get_note_url(related_note.id, self.notebook),
+                    )
+                    for related_note in related_notes
+                    if related_note is not None
+                ]
+            ),
+            SuggestedTagList(
+                items=[
+                    TagButton(
+                        id=f"suggested-tag-{tag.name}-button",
+                        label=tag.name,
+                        num_notes=tag.num_notes,
+                        url=f"/notes?tag={tag.name}&{notebook_query}".rstrip("&"),
+                        active=False,
+                    )
+                    for tag in suggested_tags
+                ]
+            ),
         ]
         return super()._post_init()
 
@@ -326,6 +555,10 @@ class NoteOverviewPage(Page):
 
     def _post_init(self) -> None:
         self.children = [
+            NotebookInput(
+                value=",".join(self.query_params.get("notebook", []))
+                or DEFAULT_NOTEBOOK
+            ),
             NoteSearchInput(parent=self),
             NoteGrid(parent=self),
             TagList(parent=self),
@@ -356,7 +589,22 @@ stats_page = Page(
     ],
 )
 
+# The startup report is logged by the warm-up once it has finished. Logging
+# is left alone when the root logger already has handlers.
+logging.basicConfig(level=logging.INFO)
+
+# The pages read from the database when they are built, so the schemas have
+# to be up to date first
+startup_report = run_startup()
+
+# newsflash takes the pages as instances, so they are built here when the
+# module is imported rather than on first use. The report includes the time
+# this takes.
+app_started_at = time.perf_counter()
 app = App(
     pages=[NewNotePage(), NoteOverviewPage(), stats_page],
     template_folders=[("templates", Path.cwd() / "notetime" / "templates")],
 )
+startup_report.app_seconds = time.perf_counter() - app_started_at
+
+warm_up_thread = start_warm_up(startup_report)
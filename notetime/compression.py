@@ -0,0 +1,57 @@
+import lzma
+import zlib
+
+CODECS = ("zlib", "lzma")
+
+# Number of characters of a compressed note that is stored uncompressed, to
+# show in lists of notes without decompressing the full text
+PREVIEW_LENGTH = 500
+
+
+def compress_bytes(data: bytes, codec: str) -> bytes:
+    if codec == "zlib":
+        return zlib.compress(data)
+    elif codec == "lzma":
+        return lzma.compress(data)
+    else:
+        raise ValueError(f"Unknown codec: {codec}")
+
+
+def decompress_bytes(data: bytes, codec: str) -> bytes:
+    if codec == "zlib":
+        return zlib.decompress(data)
+    elif codec == "lzma":
+        return lzma.decompress(data)
+    else:
+        raise ValueError(f"Unknown codec: {codec}")
+
+
+def encode_text(
+    text: str,
+    threshold: int | None,
+    codec: str,
+) -> tuple[str | bytes, str | None, str | None]:
+    """
+    Return the value to store for `text`, with its codec and preview. Texts
+    smaller than `threshold` bytes are stored as they are, without codec and
+    preview. A `threshold` of `None` disables compression.
+    """
+    # A character takes at most four bytes in UTF-8, so short texts can be
+    # stored without encoding them first
+    if threshold is None or len(text) * 4 < threshold:
+        return text, None, None
+
+    data = text.encode()
+    if len(data) < threshold:
+        return text, None, None
+    return compress_bytes(data, codec), codec, text[:PREVIEW_LENGTH]
+
+
+def decode_text(value: str | bytes | None, codec: str | None) -> str:
+    if value is None:
+        return ""
+    if codec is None:
+        assert isinstance(value, str)
+        return value
+    assert isinstance(value, bytes)
+    return decompress_bytes(value, codec).decode()
@@ -1,7 +1,14 @@
+import heapq
+import math
+import re
 import sqlite3
+import time
+from collections import Counter, defaultdict
 from pathlib import Path
 from datetime import datetime, timezone
 
+from notetime.compression import decode_text, encode_text
+from notetime.search import get_trigrams, rank_candidates
 from notetime.tags import extract_tags
 
 from pydantic import BaseModel, Field
@@ -13,16 +20,97 @@ def adapt_datetime_iso(dt: datetime) -> str:
 
 sqlite3.register_adapter(datetime, adapt_datetime_iso)
 
-PATH_TO_DB = Path.cwd() / "data" / "db.sqlite3"
-
-
-def get_db_connection() -> tuple[sqlite3.Connection, sqlite3.Cursor]:
-    con = sqlite3.connect(PATH_TO_DB, check_same_thread=False)
+DATA_DIR = Path.cwd() / "data"
+PATH_TO_DB = DATA_DIR / "db.sqlite3"
+
+# The default notebook is stored in `PATH_TO_DB`, every other notebook in its
+# own database file in the notebooks folder of the data directory
+DEFAULT_NOTEBOOK = "default"
+NOTEBOOK_NAME_PATTERN = re.compile(r"[a-z0-9][a-z0-9_-]*")
+
+# Number of related notes that is stored for every note
+NUM_RELATED_NOTES = 10
+
+# Tags on more notes than this are ignored when relating notes. They say
+# little about how related two notes are, and ignoring them bounds the work
+# of relating a note, and the number of notes whose related notes change
+# when a tag is added or removed.
+MAX_RELATED_TAG_NOTES = 200
+
+# Note texts of at least this many bytes are stored compressed with
+# `COMPRESSION_CODEC`. Set to `None` to store all new texts uncompressed.
+COMPRESSION_THRESHOLD: int | None = 64 * 1024
+COMPRESSION_CODEC = "zlib"
+
+# Title trigrams in more notes than this are only matched against their most
+# recent notes by `search_notes`, so that a query made of common words does
+# not have to count the postings of a large part of all notes
+MAX_TRIGRAM_POSTINGS = 1000
+
+# Seconds to wait between the write transactions of a rebuild. SQLite only
+# retries a locked write every 100 ms, so without a pause the writes of the
+# app keep missing the short gaps between two chunks.
+REBUILD_PAUSE = 0.1
+
+# Stored in `PRAGMA user_version` by `initialize_database`. Increase it when
+# the schema changes, so that existing databases are upgraded on startup.
+SCHEMA_VERSION = 4
+
+
+def get_notebook_path(
+    notebook: str = DEFAULT_NOTEBOOK,
+    data_dir: Path = DATA_DIR,
+) -> Path:
+    if notebook == DEFAULT_NOTEBOOK:
+        return data_dir / PATH_TO_DB.name
+    if not NOTEBOOK_NAME_PATTERN.fullmatch(notebook):
+        raise ValueError(f"Invalid notebook name: {notebook!r}")
+    return data_dir / "notebooks" / f"{notebook}.sqlite3"
+
+
+def list_notebooks(data_dir: Path = DATA_DIR) -> list[str]:
+    notebooks = [DEFAULT_NOTEBOOK]
+    for path in sorted((data_dir / "notebooks").glob("*.sqlite3")):
+        if NOTEBOOK_NAME_PATTERN.fullmatch(path.stem):
+            notebooks.append(path.stem)
+    return notebooks
+
+
+def create_notebook(notebook: str, data_dir: Path = DATA_DIR) -> Path:
+    path = get_notebook_path(notebook, data_dir)
+    if path.exists():
+        raise ValueError(f"Notebook already exists: {notebook!r}")
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    con = sqlite3.connect(path)
+    cur = con.cursor()
+    initialize_database(con, cur)
+    con.close()
+    return path
+
+
+def get_db_connection(
+    notebook: str = DEFAULT_NOTEBOOK,
+) -> tuple[sqlite3.Connection, sqlite3.Cursor]:
+    path = get_notebook_path(notebook)
+    if notebook != DEFAULT_NOTEBOOK and not path.exists():
+        # Connecting would create an empty file without any tables
+        raise ValueError(f"Unknown notebook: {notebook!r}")
+    con = sqlite3.connect(path, check_same_thread=False)
     con.execute("PRAGMA foreign_keys = ON;")
     cur = con.cursor()
     return con, cur
 
 
+def join_title_and_text(title: str, text: str) -> str:
+    if title and text:
+        return f"{title}\n{text}"
+    elif title:
+        return title
+    else:
+        return text
+
+
 class Note(BaseModel):
     id: int | None = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
@@ -30,17 +118,14 @@ class Note(BaseModel):
     title: str = ""
     text: str = ""
     tags: list[str] | None = None
+    # Only set for notes returned by queries over several notebooks
+    notebook: str | None = None
 
     def set_updated_at_now(self) -> None:
         self.updated_at = datetime.now(timezone.utc)
 
     def get_full_text(self) -> str:
-        if self.title and self.text:
-            return f"{self.title}\n{self.text}"
-        elif self.title:
-            return self.title
-        else:
-            return self.text
+        return join_title_and_text(self.title, self.text)
 
     def set_tags_from_text(self) -> None:
         self.tags = extract_tags(self.get_full_text())
@@ -75,6 +160,18 @@ CREATE TABLE IF NOT EXISTS notes (
 );
 """
 
+# Compressed texts of notes, kept apart from `notes` so that listing notes
+# never reads their pages. For a compressed note, `notes.text` only holds
+# the first `PREVIEW_LENGTH` characters.
+CREATE_NOTE_BODIES = """
+CREATE TABLE IF NOT EXISTS note_bodies (
+    note_id INTEGER PRIMARY KEY,
+    codec TEXT NOT NULL,
+    body BLOB NOT NULL,
+    FOREIGN KEY (note_id) REFERENCES notes(id) ON DELETE CASCADE
+);
+"""
+
 CREATE_TAGS = """
 CREATE TABLE IF NOT EXISTS tags (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -92,19 +189,215 @@ CREATE TABLE IF NOT EXISTS note_tags (
 );
 """
 
+CREATE_NOTE_TITLE_TRIGRAMS = """
+CREATE TABLE IF NOT EXISTS note_title_trigrams (
+    trigram TEXT NOT NULL,
+    note_id INTEGER NOT NULL,
+    PRIMARY KEY (trigram, note_id),
+    FOREIGN KEY (note_id) REFERENCES notes(id) ON DELETE CASCADE
+) WITHOUT ROWID;
+"""
+
+# Number of notes with each trigram in their title
+CREATE_NOTE_TITLE_TRIGRAM_COUNTS = """
+CREATE TABLE IF NOT EXISTS note_title_trigram_counts (
+    trigram TEXT PRIMARY KEY,
+    num_notes INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+CREATE_TAG_TRIGRAMS = """
+CREATE TABLE IF NOT EXISTS tag_trigrams (
+    trigram TEXT NOT NULL,
+    tag_id INTEGER NOT NULL,
+    PRIMARY KEY (trigram, tag_id),
+    FOREIGN KEY (tag_id) REFERENCES tags(id) ON DELETE CASCADE
+) WITHOUT ROWID;
+"""
+
+# Number of notes that have both tags, stored in both directions. The rows
+# with tag_a = tag_b hold the number of notes with that tag.
+CREATE_TAG_COOCCURRENCE = """
+CREATE TABLE IF NOT EXISTS tag_cooccurrence (
+    tag_a INTEGER NOT NULL,
+    tag_b INTEGER NOT NULL,
+    num_notes INTEGER NOT NULL,
+    PRIMARY KEY (tag_a, tag_b),
+    FOREIGN KEY (tag_a) REFERENCES tags(id) ON DELETE CASCADE,
+    FOREIGN KEY (tag_b) REFERENCES tags(id) ON DELETE CASCADE
+) WITHOUT ROWID;
+"""
+
+CREATE_RELATED_NOTES = """
+CREATE TABLE IF NOT EXISTS related_notes (
+    note_id INTEGER NOT NULL,
+    related_note_id INTEGER NOT NULL,
+    score REAL NOT NULL,
+    PRIMARY KEY (note_id, related_note_id),
+    FOREIGN KEY (note_id) REFERENCES notes(id) ON DELETE CASCADE,
+    FOREIGN KEY (related_note_id) REFERENCES notes(id) ON DELETE CASCADE
+) WITHOUT ROWID;
+"""
+
+# Flags about the state of a database, such as NEEDS_REINDEX
+CREATE_METADATA = """
+CREATE TABLE IF NOT EXISTS metadata (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+# Set when the tags, the indexes and the other data derived from the notes
+# are missing or wrong, and cleared by `notetime.reindex`
+NEEDS_REINDEX = "needs_reindex"
+
+CREATE_RELATED_NOTES_REBUILD = """
+CREATE TABLE related_notes_rebuild (
+    note_id INTEGER NOT NULL,
+    related_note_id INTEGER NOT NULL,
+    score REAL NOT NULL,
+    PRIMARY KEY (note_id, related_note_id),
+    FOREIGN KEY (note_id) REFERENCES notes(id) ON DELETE CASCADE,
+    FOREIGN KEY (related_note_id) REFERENCES notes(id) ON DELETE CASCADE
+) WITHOUT ROWID;
+"""
+
+# Secondary indexes by name, as (table, column). An index cannot be renamed,
+# so the index of a table that is rebuilt in a shadow table and swapped in
+# takes turns between its name and its name with a "_rebuild" suffix.
+INDEXES = {
+    "note_tags_tag_id": ("note_tags", "tag_id"),
+    "note_title_trigrams_note_id": ("note_title_trigrams", "note_id"),
+    "tag_trigrams_tag_id": ("tag_trigrams", "tag_id"),
+    "related_notes_related_note_id": ("related_notes", "related_note_id"),
+}
+
+
+def create_index(cur: sqlite3.Cursor, name: str, table: str | None = None) -> None:
+    """
+    Create the index `name` from `INDEXES`. Without `table`, it is created
+    on its own table unless that already has it under either name. With
+    `table`, it is created on that shadow table under the name that is not
+    in use.
+    """
+    cur.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND name IN (?, ?)",
+        (name, f"{name}_rebuild"),
+    )
+    existing_names = {row[0] for row in cur.fetchall()}
+    own_table, column = INDEXES[name]
+    if table is None:
+        if len(existing_names) > 0:
+            return
+        table = own_table
+    elif name in existing_names:
+        name = f"{name}_rebuild"
+    cur.execute(f"CREATE INDEX {name} ON {table} ({column})")
+
+
+def drop_table(con: sqlite3.Connection, cur: sqlite3.Cursor, table: str) -> None:
+    """
+    Drop a table that may be large, if it exists. Dropping only frees its
+    pages, but that still takes a while for a large table, so its indexes
+    are dropped first, each in its own transaction, to keep every hold of
+    the write lock short.
+    """
+    cur.execute(
+        """
+        SELECT name FROM sqlite_master
+        WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL
+        """,
+        (table,),
+    )
+    for (name,) in cur.fetchall():
+        cur.execute(f"DROP INDEX {name}")
+        con.commit()
+    cur.execute(f"DROP TABLE IF EXISTS {table}")
+    con.commit()
+
+
+def initialize_database(con: sqlite3.Connection, cur: sqlite3.Cursor) -> bool:
+    """
+    Create the tables, columns and indexes that are missing from the
+    database, and the in-progress note with id 1. Existing data is never
+    touched, so this is safe to run on every startup, and a database that is
+    already at `SCHEMA_VERSION` is recognized by a single pragma. Returns
+    whether the database was changed.
+    """
+    cur.execute("PRAGMA user_version;")
+    if cur.fetchone()[0] >= SCHEMA_VERSION:
+        return False
+
+    # Has to be set before the first table is created, and allows the
+    # maintenance scheduler to reclaim free pages with incremental vacuum
+    cur.execute("PRAGMA auto_vacuum = INCREMENTAL;")
+
+    # Several app processes may start at the same time, so the version is
+    # checked again once the write lock is held
+    cur.execute("BEGIN IMMEDIATE;")
+    cur.execute("PRAGMA user_version;")
+    version = cur.fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        con.rollback()
+        return False
 
-def initialize_database(con: sqlite3.Connection, cur: sqlite3.Cursor):
     cur.execute(CREATE_NOTES)
+    cur.execute(CREATE_NOTE_BODIES)
     cur.execute(CREATE_TAGS)
     cur.execute(CREATE_NOTE_TAGS)
+    cur.execute(CREATE_NOTE_TITLE_TRIGRAMS)
+    cur.execute(CREATE_NOTE_TITLE_TRIGRAM_COUNTS)
+    cur.execute(CREATE_TAG_TRIGRAMS)
+    cur.execute(CREATE_TAG_COOCCURRENCE)
+    cur.execute(CREATE_RELATED_NOTES)
+    cur.execute(CREATE_METADATA)
+    for name in INDEXES:
+        create_index(cur, name)
+
+    # Databases from before the schema version have notes but none of the
+    # data derived from them, which the incremental updates rely on
+    if version == 0:
+        cur.execute("SELECT 1 FROM notes WHERE id != 1 LIMIT 1")
+        if cur.fetchone() is not None:
+            set_needs_reindex(cur, True)
+
+    # The trigram counts were added in version 2
+    if version < 2:
+        count_note_title_trigrams(cur)
+
+    # Compressed texts were stored in the notes before version 4
+    if version < 4:
+        _move_note_bodies(cur)
+
+    now = datetime.now(timezone.utc)
+    cur.execute(
+        """
+        INSERT OR IGNORE INTO notes (id, created_at, updated_at, title, text)
+        VALUES (1, ?, ?, '', '')
+        """,
+        (now, now),
+    )
+    cur.execute(f"PRAGMA user_version = {SCHEMA_VERSION};")
     con.commit()
+    return True
 
-    note = create_note(
-        con=con,
-        cur=cur,
-        text="",
-    )
-    assert note.id == 1
+
+def needs_reindex(cur: sqlite3.Cursor) -> bool:
+    cur.execute("SELECT value FROM metadata WHERE key = ?", (NEEDS_REINDEX,))
+    return cur.fetchone() is not None
+
+
+def set_needs_reindex(cur: sqlite3.Cursor, value: bool) -> None:
+    """
+    Set or clear the flag as part of the transaction of the caller.
+    """
+    if value:
+        cur.execute(
+            "INSERT OR REPLACE INTO metadata (key, value) VALUES (?, '1')",
+            (NEEDS_REINDEX,),
+        )
+    else:
+        cur.execute("DELETE FROM metadata WHERE key = ?", (NEEDS_REINDEX,))
 
 
 def upsert_tags(
@@ -134,29 +427,325 @@ def upsert_tags(
     return tag_ids
 
 
-def update_note_tags(
+def sync_note_tags(
     con: sqlite3.Connection,
     cur: sqlite3.Cursor,
     note_id: int,
-    tag_ids: list[int],
+    tags: list[str],
 ) -> None:
-    cur.execute("BEGIN;")
+    """
+    Bring the stored tags of a note in line with `tags`, only touching the
+    links that were added or removed. Does nothing when the tags did not
+    change.
+    """
+    cur.execute(
+        """
+        SELECT t.id, t.name FROM tags t
+        JOIN note_tags nt ON t.id = nt.tag_id
+        WHERE nt.note_id = ?
+        """,
+        (note_id,),
+    )
+    current_tags = {row[1]: row[0] for row in cur.fetchall()}
+    new_tags = set(tags)
 
-    tag_ids_placeholders = ",".join("?" for _ in tag_ids)
+    added_tags = [tag for tag in dict.fromkeys(tags) if tag not in current_tags]
+    removed_tag_ids = [
+        tag_id for name, tag_id in current_tags.items() if name not in new_tags
+    ]
+    if len(added_tags) == 0 and len(removed_tag_ids) == 0:
+        return
+
+    added_tag_ids: list[int] = []
+    if len(added_tags) > 0:
+        added_tag_ids = upsert_tags(con=con, cur=cur, tags=added_tags)
+        cur.executemany(
+            "INSERT OR IGNORE INTO note_tags (note_id, tag_id) VALUES (?, ?)",
+            [(note_id, tag_id) for tag_id in added_tag_ids],
+        )
+        index_tag_names(con=con, cur=cur, tags=added_tags)
+
+    if len(removed_tag_ids) > 0:
+        tag_ids_placeholders = ",".join("?" for _ in removed_tag_ids)
+        cur.execute(
+            "DELETE FROM note_tags WHERE note_id = ? AND "
+            f"tag_id IN ({tag_ids_placeholders})",
+            (note_id, *removed_tag_ids),
+        )
+
+    old_tag_ids = set(current_tags.values())
+    new_tag_ids = (old_tag_ids - set(removed_tag_ids)) | set(added_tag_ids)
+    update_tag_cooccurrence(cur=cur, old_tag_ids=old_tag_ids, new_tag_ids=new_tag_ids)
+
+    con.commit()
+    delete_orphaned_tags(con=con, cur=cur, tag_ids=removed_tag_ids)
+
+    update_related_notes(
+        con=con,
+        cur=cur,
+        note_id=note_id,
+        changed_tag_ids=added_tag_ids + removed_tag_ids,
+    )
+
+
+def update_tag_cooccurrence(
+    cur: sqlite3.Cursor,
+    old_tag_ids: set[int],
+    new_tag_ids: set[int],
+) -> None:
+    """
+    Update the co-occurrence counts for a note whose tags changed from
+    `old_tag_ids` to `new_tag_ids`. Only the pairs of tags that the note
+    gained or lost are touched.
+    """
+    old_pairs = {(a, b) for a in old_tag_ids for b in old_tag_ids}
+    new_pairs = {(a, b) for a in new_tag_ids for b in new_tag_ids}
+    deltas = Counter(new_pairs - old_pairs)
+    deltas.subtract(old_pairs - new_pairs)
+    add_tag_cooccurrence(cur, deltas)
+
+
+def add_tag_cooccurrence(
+    cur: sqlite3.Cursor,
+    deltas: Counter[tuple[int, int]],
+    table: str = "tag_cooccurrence",
+) -> None:
+    """
+    Add `deltas` to the co-occurrence counts of pairs of tags in `table`,
+    and delete the pairs that no note has anymore.
+    """
+    cur.executemany(
+        f"""
+        INSERT INTO {table} (tag_a, tag_b, num_notes) VALUES (?, ?, ?)
+        ON CONFLICT(tag_a, tag_b) DO UPDATE SET num_notes = num_notes + excluded.num_notes
+        """,
+        [(a, b, delta) for (a, b), delta in deltas.items() if delta != 0],
+    )
+    cur.executemany(
+        f"DELETE FROM {table} WHERE tag_a = ? AND tag_b = ? AND num_notes <= 0",
+        [(a, b) for (a, b), delta in deltas.items() if delta < 0],
+    )
+
+
+def add_note_title_trigram_counts(
+    cur: sqlite3.Cursor,
+    deltas: Counter[str],
+    table: str = "note_title_trigram_counts",
+) -> None:
+    """
+    Add `deltas` to the number of notes with each title trigram in `table`,
+    and delete the trigrams that no title has anymore.
+    """
+    cur.executemany(
+        f"""
+        INSERT INTO {table} (trigram, num_notes) VALUES (?, ?)
+        ON CONFLICT (trigram) DO UPDATE SET num_notes = num_notes + excluded.num_notes
+        """,
+        [(trigram, delta) for trigram, delta in deltas.items() if delta != 0],
+    )
+    cur.executemany(
+        f"DELETE FROM {table} WHERE trigram = ? AND num_notes <= 0",
+        [(trigram,) for trigram, delta in deltas.items() if delta < 0],
+    )
+
+
+def get_tag_weight(num_notes: int) -> float:
+    """
+    Weight of a tag when comparing notes: tags that are used by many notes
+    say less about how related two notes are.
+    """
+    return 1 / math.log(1 + max(num_notes, 1))
+
+
+def get_tag_weights(cur: sqlite3.Cursor, tag_ids: list[int]) -> dict[int, float]:
+    """
+    Weights of the tags in `tag_ids` that are on at most
+    `MAX_RELATED_TAG_NOTES` notes. The other tags are left out.
+    """
+    cur.execute(
+        f"""
+        SELECT tag_a, num_notes FROM tag_cooccurrence
+        WHERE tag_a = tag_b AND tag_a IN ({",".join("?" for _ in tag_ids)})
+        AND num_notes <= ?
+        """,
+        tag_ids + [MAX_RELATED_TAG_NOTES],
+    )
+    return {row[0]: get_tag_weight(row[1]) for row in cur.fetchall()}
+
+
+def compute_related_notes_batch(
+    cur: sqlite3.Cursor,
+    note_ids: list[int],
+    limit: int = NUM_RELATED_NOTES,
+) -> dict[int, list[tuple[int, float]]]:
+    """
+    Return the ids and scores of the notes most related to each of
+    `note_ids`. The score of two notes is the summed weight of the tags they
+    share, where tags on more than `MAX_RELATED_TAG_NOTES` notes do not
+    count. The notes of every tag are read once for the whole batch.
+    """
+    if len(note_ids) == 0:
+        return {}
+    cur.execute(
+        f"""
+        SELECT note_id, tag_id FROM note_tags
+        WHERE note_id IN ({",".join("?" for _ in note_ids)})
+        ORDER BY note_id, tag_id
+        """,
+        note_ids,
+    )
+    tags_per_note: defaultdict[int, list[int]] = defaultdict(list)
+    for note_id, tag_id in cur.fetchall():
+        tags_per_note[note_id].append(tag_id)
+
+    tag_ids = list({tag_id for ids in tags_per_note.values() for tag_id in ids})
+    weights = get_tag_weights(cur, tag_ids) if len(tag_ids) > 0 else {}
+
+    notes_per_tag: defaultdict[int, list[int]] = defaultdict(list)
+    if len(weights) > 0:
+        cur.execute(
+            f"""
+            SELECT tag_id, note_id FROM note_tags
+            WHERE tag_id IN ({",".join("?" for _ in weights)}) AND note_id != 1
+            """,
+            list(weights),
+        )
+        for tag_id, note_id in cur.fetchall():
+            notes_per_tag[tag_id].append(note_id)
+
+    related: dict[int, list[tuple[int, float]]] = {}
+    for note_id in note_ids:
+        scores: defaultdict[int, float] = defaultdict(float)
+        for tag_id in tags_per_note[note_id]:
+            if tag_id in weights:
+                for related_note_id in notes_per_tag[tag_id]:
+                    scores[related_note_id] += weights[tag_id]
+        scores.pop(note_id, None)
+        related[note_id] = heapq.nsmallest(
+            limit, scores.items(), key=lambda item: (-item[1], item[0])
+        )
+    return related
+
+
+def compute_related_notes(
+    cur: sqlite3.Cursor,
+    note_id: int,
+    limit: int = NUM_RELATED_NOTES,
+) -> list[tuple[int, float]]:
+    return compute_related_notes_batch(cur, [note_id], limit)[note_id]
+
+
+def _write_related_notes(
+    cur: sqlite3.Cursor,
+    related: dict[int, list[tuple[int, float]]],
+    table: str = "related_notes",
+) -> None:
+    note_ids = list(related)
+    cur.execute(
+        f"DELETE FROM {table} WHERE note_id IN ({','.join('?' for _ in note_ids)})",
+        note_ids,
+    )
+    cur.executemany(
+        f"INSERT INTO {table} (note_id, related_note_id, score) VALUES (?, ?, ?)",
+        [
+            (note_id, related_note_id, score)
+            for note_id, scores in related.items()
+            for related_note_id, score in scores
+        ],
+    )
+
+
+def update_related_notes(
+    con: sqlite3.Connection,
+    cur: sqlite3.Cursor,
+    note_id: int,
+    changed_tag_ids: list[int],
+) -> None:
+    """
+    Recompute the related notes of every note that a change to the tags of a
+    note can affect, so that they are the same as after a full rebuild: the
+    note itself, and the notes with one of `changed_tag_ids`, which are the
+    only ones whose scores changed. Changed tags that are on too many notes
+    to count, both before and after the change, are skipped.
+    """
+    affected_note_ids = {note_id}
+    if len(changed_tag_ids) > 0:
+        cur.execute(
+            f"""
+            SELECT nt.note_id FROM note_tags nt
+            JOIN tag_cooccurrence c ON c.tag_a = nt.tag_id AND c.tag_b = nt.tag_id
+            WHERE nt.tag_id IN ({",".join("?" for _ in changed_tag_ids)})
+            AND c.num_notes <= ?
+            """,
+            changed_tag_ids + [MAX_RELATED_TAG_NOTES + 1],
+        )
+        affected_note_ids.update(row[0] for row in cur.fetchall())
+    # Related notes are not stored for the in-progress note, but its tags
+    # still count towards the weights of the tags of other notes
+    affected_note_ids.discard(1)
+    if len(affected_note_ids) == 0:
+        return
+
+    related = compute_related_notes_batch(cur, sorted(affected_note_ids))
+    _write_related_notes(cur, related)
+
+    # A rebuild that is in progress would otherwise miss this change for
+    # the notes it has already processed
+    cur.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+        ("related_notes_rebuild",),
+    )
+    if cur.fetchone() is not None:
+        _write_related_notes(cur, related, table="related_notes_rebuild")
+    con.commit()
+
+
+def index_note_title(
+    con: sqlite3.Connection,
+    cur: sqlite3.Cursor,
+    note_id: int,
+    title: str,
+) -> None:
+    """
+    Update the trigram index for the title of a note, only touching the
+    trigrams that changed.
+    """
     cur.execute(
-        "DELETE FROM note_tags WHERE note_id = ? AND "
-        f"tag_id NOT IN ({tag_ids_placeholders})",
-        (note_id, *tag_ids),
+        "SELECT trigram FROM note_title_trigrams WHERE note_id = ?",
+        (note_id,),
     )
+    current_trigrams = {row[0] for row in cur.fetchall()}
+    new_trigrams = get_trigrams(title)
+    if current_trigrams == new_trigrams:
+        return
 
     cur.executemany(
-        "INSERT OR IGNORE INTO note_tags (note_id, tag_id) VALUES (?, ?)",
-        [(note_id, tag_id) for tag_id in tag_ids],
+        "DELETE FROM note_title_trigrams WHERE trigram = ? AND note_id = ?",
+        [(trigram, note_id) for trigram in current_trigrams - new_trigrams],
     )
+    cur.executemany(
+        "INSERT OR IGNORE INTO note_title_trigrams (trigram, note_id) VALUES (?, ?)",
+        [(trigram, note_id) for trigram in new_trigrams - current_trigrams],
+    )
+    deltas = Counter(new_trigrams - current_trigrams)
+    deltas.subtract(current_trigrams - new_trigrams)
+    add_note_title_trigram_counts(cur, deltas)
+    con.commit()
 
-    cur.execute("COMMIT;")
+
+def index_tag_names(
+    con: sqlite3.Connection,
+    cur: sqlite3.Cursor,
+    tags: list[str],
+) -> None:
+    cur.executemany(
+        """
+        INSERT OR IGNORE INTO tag_trigrams (trigram, tag_id)
+        SELECT ?, id FROM tags WHERE name = ?
+        """,
+        [(trigram, tag) for tag in tags for trigram in get_trigrams(tag)],
+    )
     con.commit()
-    delete_unused_tags(con, cur)
 
 
 def create_note(
@@ -179,18 +768,30 @@ def create_note(
     note.set_tags_from_text()
     assert note.tags is not None
 
+    stored_text, codec, preview = encode_text(
+        text, threshold=COMPRESSION_THRESHOLD, codec=COMPRESSION_CODEC
+    )
     cur.execute(
-        "INSERT INTO notes (title, text, created_at, updated_at) VALUES (?, ?, ?, ?)",
-        (title, text, note.created_at, note.updated_at),
+        """
+        INSERT INTO notes (title, text, created_at, updated_at)
+        VALUES (?, ?, ?, ?)
+        """,
+        (
+            title,
+            stored_text if codec is None else preview,
+            note.created_at,
+            note.updated_at,
+        ),
     )
-    con.commit()
-
     note_id = cur.lastrowid
     assert note_id is not None
     note.id = note_id
 
-    tag_ids = upsert_tags(con=con, cur=cur, tags=note.tags)
-    update_note_tags(con=con, cur=cur, note_id=note.id, tag_ids=tag_ids)
+    _write_note_body(cur, note_id, stored_text, codec)
+    con.commit()
+
+    index_note_title(con=con, cur=cur, note_id=note.id, title=note.title)
+    sync_note_tags(con=con, cur=cur, note_id=note.id, tags=note.tags)
 
     return note
 
@@ -205,38 +806,96 @@ def update_note(
     assert note.tags is not None
 
     note.set_updated_at_now()
+    stored_text, codec, preview = encode_text(
+        note.text, threshold=COMPRESSION_THRESHOLD, codec=COMPRESSION_CODEC
+    )
     cur.execute(
         "UPDATE notes SET title = ?, text = ?, updated_at = ? WHERE id = ?",
-        (note.title, note.text, note.updated_at, note.id),
+        (
+            note.title,
+            stored_text if codec is None else preview,
+            note.updated_at,
+            note.id,
+        ),
     )
+    _write_note_body(cur, note.id, stored_text, codec)
     con.commit()
 
-    tag_ids = upsert_tags(con=con, cur=cur, tags=note.tags)
-    update_note_tags(con=con, cur=cur, note_id=note.id, tag_ids=tag_ids)
+    index_note_title(con=con, cur=cur, note_id=note.id, title=note.title)
+    sync_note_tags(con=con, cur=cur, note_id=note.id, tags=note.tags)
 
     updated_note = get_note_by_id(cur, note.id)
     assert updated_note is not None
     return updated_note
 
 
+def _write_note_body(
+    cur: sqlite3.Cursor,
+    note_id: int,
+    stored_text: str | bytes,
+    codec: str | None,
+) -> None:
+    """
+    Store the compressed text of a note in `note_bodies`, or remove the one
+    it had if its text is now stored uncompressed in `notes`.
+    """
+    if codec is None:
+        cur.execute("DELETE FROM note_bodies WHERE note_id = ?", (note_id,))
+        return
+
+    cur.execute(
+        """
+        INSERT INTO note_bodies (note_id, codec, body) VALUES (?, ?, ?)
+        ON CONFLICT(note_id) DO UPDATE SET codec = excluded.codec, body = excluded.body
+        """,
+        (note_id, codec, stored_text),
+    )
+
+
+def _move_note_bodies(cur: sqlite3.Cursor) -> None:
+    """
+    Move the compressed texts that databases before version 4 stored in
+    `notes.text`, with their codec and preview in two more columns, to
+    `note_bodies`, and keep the preview as the text of the note.
+    """
+    cur.execute("PRAGMA table_info(notes)")
+    if "codec" not in {row[1] for row in cur.fetchall()}:
+        return
+
+    cur.execute("""
+        INSERT OR REPLACE INTO note_bodies (note_id, codec, body)
+        SELECT id, codec, text FROM notes WHERE codec IS NOT NULL
+    """)
+    cur.execute("UPDATE notes SET text = preview WHERE codec IS NOT NULL")
+    cur.execute("ALTER TABLE notes DROP COLUMN preview")
+    cur.execute("ALTER TABLE notes DROP COLUMN codec")
+
+
 def get_note_by_id(
     cur: sqlite3.Cursor,
     note_id: int,
 ) -> Note | None:
     cur.execute(
-        "SELECT id, created_at, updated_at, title, text FROM notes WHERE id = ?",
+        """
+        SELECT n.id, n.created_at, n.updated_at, n.title, n.text, b.codec, b.body
+        FROM notes n
+        LEFT JOIN note_bodies b ON b.note_id = n.id
+        WHERE n.id = ?
+        """,
         (note_id,),
     )
     row = cur.fetchone()
     if row is None:
         return None
 
+    # Compressed notes only keep their preview in `notes.text`
+    stored_text = row[4] if row[5] is None else row[6]
     note = Note(
         id=row[0],
         created_at=row[1],
         updated_at=row[2],
         title=row[3] or "",
-        text=row[4] or "",
+        text=decode_text(stored_text, row[5]),
     )
     note.fetch_tags_from_db(cur)
     return note
@@ -247,7 +906,8 @@ def get_notes_by_tags(
     tag_names: list[str],
 ) -> list[Note]:
     q = f"""
-        SELECT n.id, n.created_at, n.updated_at, n.title, n.text FROM notes n
+        SELECT n.id, n.created_at, n.updated_at, n.title, n.text
+        FROM notes n
         JOIN note_tags nt ON n.id = nt.note_id
         JOIN tags t ON nt.tag_id = t.id
         WHERE t.name IN ({",".join("?" for _ in tag_names)})
@@ -291,6 +951,169 @@ def get_all_tags(
     return sorted(tags, key=lambda tag: tag.num_notes, reverse=True)
 
 
+def get_related_notes(
+    cur: sqlite3.Cursor,
+    note_id: int,
+    limit: int = NUM_RELATED_NOTES,
+) -> list[Note]:
+    cur.execute(
+        """
+        SELECT n.id, n.created_at, n.updated_at, n.title, n.text
+        FROM related_notes r
+        JOIN notes n ON n.id = r.related_note_id
+        WHERE r.note_id = ?
+        ORDER BY r.score DESC, r.related_note_id
+        LIMIT ?
+        """,
+        (note_id, limit),
+    )
+
+    notes = []
+    for row in cur.fetchall():
+        note = Note(
+            id=row[0],
+            created_at=row[1],
+            updated_at=row[2],
+            title=row[3] or "",
+            text=row[4] or "",
+        )
+        notes.append(note)
+
+    return notes
+
+
+def get_note_titles(
+    cur: sqlite3.Cursor,
+    note_ids: list[int],
+) -> list[Note]:
+    """
+    Return the notes with the given ids in the same order, with only their
+    id and title set. Used for lists of notes that only show the titles.
+    """
+    note_ids_placeholders = ",".join("?" for _ in note_ids)
+    cur.execute(
+        f"SELECT id, title FROM notes WHERE id IN ({note_ids_placeholders})",
+        note_ids,
+    )
+    titles = {row[0]: row[1] or "" for row in cur.fetchall()}
+    return [
+        Note(id=note_id, title=titles[note_id])
+        for note_id in note_ids
+        if note_id in titles
+    ]
+
+
+def get_cooccurring_tags(
+    cur: sqlite3.Cursor,
+    tag_names: list[str],
+    limit: int = 5,
+) -> list[Tag]:
+    """
+    Return the tags that are most often used together with the given tags,
+    excluding the given tags themselves.
+    """
+    tag_names_placeholders = ",".join("?" for _ in tag_names)
+    cur.execute(
+        f"""
+        SELECT t.id, t.name, SUM(c.num_notes) AS num_notes
+        FROM tag_cooccurrence c
+        JOIN tags t ON t.id = c.tag_b
+        WHERE c.tag_a IN (SELECT id FROM tags WHERE name IN ({tag_names_placeholders}))
+        AND t.name NOT IN ({tag_names_placeholders})
+        GROUP BY t.id
+        ORDER BY num_notes DESC, t.name
+        LIMIT ?
+        """,
+        tag_names + tag_names + [limit],
+    )
+
+    return [Tag(id=row[0], name=row[1], num_notes=row[2]) for row in cur.fetchall()]
+
+
+def rebuild_tag_cooccurrence(
+    con: sqlite3.Connection,
+    cur: sqlite3.Cursor,
+) -> None:
+    """
+    Recompute all co-occurrence counts from `note_tags`, as the product of
+    the note-tag incidence matrix with itself in a single query.
+    """
+    cur.execute("DELETE FROM tag_cooccurrence")
+    cur.execute("""
+        INSERT INTO tag_cooccurrence (tag_a, tag_b, num_notes)
+        SELECT a.tag_id, b.tag_id, COUNT(*) FROM note_tags a
+        JOIN note_tags b ON b.note_id = a.note_id
+        GROUP BY a.tag_id, b.tag_id
+    """)
+    con.commit()
+
+
+def count_note_title_trigrams(cur: sqlite3.Cursor) -> None:
+    """
+    Recompute the number of notes with each title trigram from the index,
+    as part of the transaction of the caller.
+    """
+    cur.execute("DELETE FROM note_title_trigram_counts")
+    cur.execute("""
+        INSERT INTO note_title_trigram_counts (trigram, num_notes)
+        SELECT trigram, COUNT(*) FROM note_title_trigrams GROUP BY trigram
+    """)
+
+
+def rebuild_related_notes(
+    con: sqlite3.Connection,
+    cur: sqlite3.Cursor,
+    chunk_size: int = 1000,
+) -> None:
+    """
+    Recompute the related notes of all notes into a shadow table, which is
+    swapped in at the end. Every chunk of notes is computed and committed in
+    its own short write transaction followed by a pause, so the app keeps
+    running. Changes made
+    in between are written to the shadow table by `update_related_notes`.
+    The swap only renames tables, and the old table is dropped afterwards.
+    """
+    # Left behind by a rebuild that did not finish
+    drop_table(con, cur, "related_notes_rebuild")
+    drop_table(con, cur, "related_notes_old")
+
+    cur.execute(CREATE_RELATED_NOTES_REBUILD)
+    create_index(cur, "related_notes_related_note_id", table="related_notes_rebuild")
+    con.commit()
+
+    last_note_id = 1
+    while True:
+        cur.execute("BEGIN IMMEDIATE;")
+        try:
+            cur.execute(
+                "SELECT id FROM notes WHERE id > ? ORDER BY id LIMIT ?",
+                (last_note_id, chunk_size),
+            )
+            note_ids = [row[0] for row in cur.fetchall()]
+            if len(note_ids) > 0:
+                related = compute_related_notes_batch(cur, note_ids)
+                _write_related_notes(cur, related, table="related_notes_rebuild")
+            con.commit()
+        except Exception:
+            con.rollback()
+            raise
+        if len(note_ids) == 0:
+            break
+        last_note_id = note_ids[-1]
+        time.sleep(REBUILD_PAUSE)
+
+    cur.execute("BEGIN IMMEDIATE;")
+    try:
+        cur.execute("ALTER TABLE related_notes RENAME TO related_notes_old")
+        cur.execute("ALTER TABLE related_notes_rebuild RENAME TO related_notes")
+        con.commit()
+    except Exception:
+        con.rollback()
+        raise
+
+    drop_table(con, cur, "related_notes_old")
+
+
 def delete_unused_tags(
     con: sqlite3.Connection,
     cur: sqlite3.Cursor,
@@ -299,9 +1122,96 @@ def delete_unused_tags(
         DELETE FROM tags
         WHERE id NOT IN (SELECT DISTINCT tag_id FROM note_tags)
     """)
+    cur.execute("""
+        DELETE FROM tag_trigrams
+        WHERE tag_id NOT IN (SELECT id FROM tags)
+    """)
+    con.commit()
+
+
+def delete_orphaned_tags(
+    con: sqlite3.Connection,
+    cur: sqlite3.Cursor,
+    tag_ids: list[int],
+) -> None:
+    """
+    Delete the given tags if no note links to them anymore. Unlike
+    `delete_unused_tags`, this only checks the given tags.
+    """
+    if len(tag_ids) == 0:
+        return
+
+    tag_ids_placeholders = ",".join("?" for _ in tag_ids)
+    cur.execute(
+        f"""
+        DELETE FROM tags
+        WHERE id IN ({tag_ids_placeholders})
+        AND NOT EXISTS (SELECT 1 FROM note_tags WHERE tag_id = tags.id)
+        """,
+        tag_ids,
+    )
+    cur.execute(
+        f"""
+        DELETE FROM tag_trigrams
+        WHERE tag_id IN ({tag_ids_placeholders})
+        AND tag_id NOT IN (SELECT id FROM tags)
+        """,
+        tag_ids,
+    )
     con.commit()
 
 
+def compress_existing_notes(
+    con: sqlite3.Connection,
+    cur: sqlite3.Cursor,
+    threshold: int | None = COMPRESSION_THRESHOLD,
+    codec: str = COMPRESSION_CODEC,
+    chunk_size: int = 100,
+) -> int:
+    """
+    Compress the stored texts of existing notes that are at least `threshold`
+    bytes into `note_bodies`, one chunk at a time. A note whose text changed
+    after it was read is left alone, as it was already stored by the app.
+    Returns the number of notes that were compressed.
+    """
+    if threshold is None:
+        return 0
+
+    num_compressed = 0
+    last_note_id = 0
+    while True:
+        cur.execute(
+            """
+            SELECT id, text FROM notes
+            WHERE id > ? AND length(CAST(text AS BLOB)) >= ?
+            AND NOT EXISTS (SELECT 1 FROM note_bodies WHERE note_id = notes.id)
+            ORDER BY id
+            LIMIT ?
+            """,
+            (last_note_id, threshold, chunk_size),
+        )
+        rows = cur.fetchall()
+        if len(rows) == 0:
+            break
+
+        for note_id, text in rows:
+            stored_text, note_codec, preview = encode_text(
+                text, threshold=threshold, codec=codec
+            )
+            cur.execute(
+                "UPDATE notes SET text = ? WHERE id = ? AND text = ?",
+                (preview, note_id, text),
+            )
+            if cur.rowcount == 1:
+                _write_note_body(cur, note_id, stored_text, note_codec)
+                num_compressed += 1
+        con.commit()
+
+        last_note_id = rows[-1][0]
+
+    return num_compressed
+
+
 def get_in_progress_note(
     cur: sqlite3.Cursor,
 ) -> Note:
@@ -312,7 +1222,10 @@ def get_in_progress_note(
 
 def get_all_notes(cur: sqlite3.Cursor) -> list[Note]:
     cur.execute(
-        "SELECT id, title, text, created_at, updated_at FROM notes ORDER BY updated_at DESC"
+        """
+        SELECT id, title, text, created_at, updated_at FROM notes
+        ORDER BY updated_at DESC
+        """
     )
     notes = [
         Note(
@@ -327,3 +1240,152 @@ def get_all_notes(cur: sqlite3.Cursor) -> list[Note]:
     ]
 
     return notes
+
+
+def get_title_candidates_query(
+    cur: sqlite3.Cursor,
+    trigrams: list[str],
+    num_candidates: int,
+    schema: str = "main",
+) -> tuple[str, list[str | int]]:
+    """
+    Build the query for the ids of the notes in `schema` that share the most
+    trigrams with a search query, with the number of shared trigrams. The
+    postings of trigrams in more than `MAX_TRIGRAM_POSTINGS` notes are only
+    read for their most recent notes, so the cost of the query is bounded by
+    the number of query trigrams instead of the number of notes. Ties are
+    broken in favour of newer notes.
+    """
+    cur.execute(
+        f"""
+        SELECT trigram FROM {schema}.note_title_trigram_counts
+        WHERE trigram IN ({",".join("?" for _ in trigrams)}) AND num_notes > ?
+        """,
+        trigrams + [MAX_TRIGRAM_POSTINGS],
+    )
+    frequent_trigrams = {row[0] for row in cur.fetchall()}
+    rare_trigrams = [
+        trigram for trigram in trigrams if trigram not in frequent_trigrams
+    ]
+
+    postings: list[str] = []
+    params: list[str | int] = []
+    if len(rare_trigrams) > 0:
+        postings.append(
+            f"""
+            SELECT note_id FROM {schema}.note_title_trigrams
+            WHERE trigram IN ({",".join("?" for _ in rare_trigrams)})
+            """
+        )
+        params += rare_trigrams
+    for trigram in frequent_trigrams:
+        postings.append(
+            f"""
+            SELECT * FROM (
+                SELECT note_id FROM {schema}.note_title_trigrams
+                WHERE trigram = ? ORDER BY note_id DESC LIMIT ?
+            )
+            """
+        )
+        params += [trigram, MAX_TRIGRAM_POSTINGS]
+
+    query = f"""
+        SELECT note_id, COUNT(*) AS num_shared FROM ({" UNION ALL ".join(postings)})
+        WHERE note_id != 1
+        GROUP BY note_id
+        ORDER BY num_shared DESC, note_id DESC
+        LIMIT ?
+    """
+    return query, params + [num_candidates]
+
+
+def search_notes(
+    cur: sqlite3.Cursor,
+    query: str,
+    limit: int = 20,
+    num_candidates: int = 50,
+) -> list[Note]:
+    """
+    Find the notes with a title close to `query`, allowing for typos. Notes
+    that share the most trigrams with the query are fetched from the index
+    first, and only those candidates are ranked by edit distance.
+    """
+    trigrams = list(get_trigrams(query))
+    if len(trigrams) == 0:
+        return []
+
+    candidates_query, params = get_title_candidates_query(cur, trigrams, num_candidates)
+    cur.execute(
+        f"""
+        SELECT n.id, n.title, c.num_shared FROM ({candidates_query}) c
+        JOIN notes n ON n.id = c.note_id
+        """,
+        params,
+    )
+    ranked = rank_candidates(query, cur.fetchall(), limit=limit)
+    note_ids = [note_id for note_id, _ in ranked]
+
+    cur.execute(
+        f"""
+        SELECT id, created_at, updated_at, title, text FROM notes
+        WHERE id IN ({",".join("?" for _ in note_ids)})
+        """,
+        note_ids,
+    )
+    notes_by_id = {
+        row[0]: Note(
+            id=row[0],
+            created_at=row[1],
+            updated_at=row[2],
+            title=row[3] or "",
+            text=row[4] or "",
+        )
+        for row in cur.fetchall()
+    }
+
+    return [notes_by_id[note_id] for note_id in note_ids]
+
+
+def search_tags(
+    cur: sqlite3.Cursor,
+    query: str,
+    limit: int = 10,
+    num_candidates: int = 100,
+) -> list[Tag]:
+    """
+    Find the tags with a name close to `query`, allowing for typos.
+    """
+    trigrams = list(get_trigrams(query))
+    if len(trigrams) == 0:
+        return []
+
+    cur.execute(
+        f"""
+        SELECT t.id, t.name, c.num_shared FROM (
+            SELECT tag_id, COUNT(*) AS num_shared FROM tag_trigrams
+            WHERE trigram IN ({",".join("?" for _ in trigrams)})
+            GROUP BY tag_id
+            ORDER BY num_shared DESC
+            LIMIT ?
+        ) c
+        JOIN tags t ON t.id = c.tag_id
+        """,
+        trigrams + [num_candidates],
+    )
+    ranked = rank_candidates(query, cur.fetchall(), limit=limit)
+    tag_ids = [tag_id for tag_id, _ in ranked]
+
+    cur.execute(
+        f"""
+        SELECT t.id, t.name, COUNT(nt.note_id) FROM tags t
+        LEFT JOIN note_tags nt ON nt.tag_id = t.id
+        WHERE t.id IN ({",".join("?" for _ in tag_ids)})
+        GROUP BY t.id
+        """,
+        tag_ids,
+    )
+    tags_by_id = {
+        row[0]: Tag(id=row[0], name=row[1], num_notes=row[2]) for row in cur.fetchall()
+    }
+
+    return [tags_by_id[tag_id] for tag_id in tag_ids]
@@ -0,0 +1,187 @@
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable
+
+from pydantic import BaseModel
+
+from notetime.db import PATH_TO_DB, delete_unused_tags, get_notebook_path
+from notetime.writer import WriteQueue, get_write_queue
+
+
+class MaintenanceConfig(BaseModel):
+    """
+    Intervals in seconds between runs of each maintenance task. A task with
+    an interval of `None` is never run by the scheduler.
+    """
+
+    optimize_interval: float | None = 60 * 60
+    checkpoint_interval: float | None = 5 * 60
+    incremental_vacuum_interval: float | None = 60 * 60
+    incremental_vacuum_pages: int = 1000
+    unused_tags_interval: float | None = 10 * 60
+    # Seconds to wait for a task that goes through the write queue. When the
+    # writer cannot get the lock in time, the task is skipped.
+    write_timeout: float = 1.0
+
+
+class TaskRun(BaseModel):
+    started_at: datetime
+    duration_seconds: float = 0.0
+    skipped: bool = False
+    error: str | None = None
+
+
+class SkipTask(Exception):
+    pass
+
+
+class MaintenanceScheduler:
+    """
+    Runs periodic database maintenance in a background thread: `PRAGMA
+    optimize`, WAL checkpoints, incremental vacuum and the removal of tags
+    that are no longer used by any note. A task is skipped, and tried again
+    at its next interval, when there are pending writes or the database is
+    locked.
+    """
+
+    def __init__(
+        self,
+        path_to_db: Path = PATH_TO_DB,
+        config: MaintenanceConfig | None = None,
+        write_queue: WriteQueue | None = None,
+    ) -> None:
+        self.config = config or MaintenanceConfig()
+        self.write_queue = write_queue
+
+        # Maintenance should never wait for a lock, so that it does not hold
+        # up the writes of the app.
+        self._con = sqlite3.connect(path_to_db, check_same_thread=False, timeout=0)
+        self._con_lock = threading.Lock()
+
+        self._tasks: dict[str, tuple[float | None, Callable[[], None]]] = {
+            "optimize": (self.config.optimize_interval, self._optimize),
+            "checkpoint": (self.config.checkpoint_interval, self._checkpoint),
+            "incremental_vacuum": (
+                self.config.incremental_vacuum_interval,
+                self._incremental_vacuum,
+            ),
+            "delete_unused_tags": (
+                self.config.unused_tags_interval,
+                self._delete_unused_tags,
+            ),
+        }
+        self._last_runs: dict[str, TaskRun] = {}
+        self._next_run_at = {
+            name: time.monotonic() + interval
+            for name, (interval, _) in self._tasks.items()
+            if interval is not None
+        }
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="notetime-maintenance", daemon=True
+        )
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self._con.close()
+
+    def last_runs(self) -> dict[str, TaskRun]:
+        return dict(self._last_runs)
+
+    def run_task(self, name: str) -> TaskRun:
+        _, task = self._tasks[name]
+        run = TaskRun(started_at=datetime.now(timezone.utc))
+        start = time.perf_counter()
+
+        try:
+            if self.write_queue is not None and self.write_queue.stats().queue_depth:
+                raise SkipTask()
+            with self._con_lock:
+                task()
+        except SkipTask:
+            run.skipped = True
+        except sqlite3.OperationalError as e:
+            if "locked" in str(e) or "busy" in str(e):
+                run.skipped = True
+            else:
+                run.error = str(e)
+        except Exception as e:
+            run.error = str(e)
+
+        run.duration_seconds = time.perf_counter() - start
+        self._last_runs[name] = run
+        return run
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            now = time.monotonic()
+            for name, next_run_at in self._next_run_at.items():
+                if next_run_at <= now:
+                    self.run_task(name)
+                    interval, _ = self._tasks[name]
+                    assert interval is not None
+                    self._next_run_at[name] = time.monotonic() + interval
+
+            if len(self._next_run_at) == 0:
+                return
+            wait = min(self._next_run_at.values()) - time.monotonic()
+            self._stop.wait(max(wait, 0))
+
+    def _optimize(self) -> None:
+        self._con.execute("PRAGMA optimize;")
+
+    def _checkpoint(self) -> None:
+        # A passive checkpoint never waits for readers or writers, it only
+        # copies the frames that are not in use
+        self._con.execute("PRAGMA wal_checkpoint(PASSIVE);").fetchall()
+
+    def _incremental_vacuum(self) -> None:
+        (auto_vacuum,) = self._con.execute("PRAGMA auto_vacuum;").fetchone()
+        # Only databases created with auto_vacuum = INCREMENTAL support this
+        if auto_vacuum != 2:
+            raise SkipTask()
+        self._con.execute(
+            f"PRAGMA incremental_vacuum({self.config.incremental_vacuum_pages});"
+        ).fetchall()
+
+    def _delete_unused_tags(self) -> None:
+        if self.write_queue is not None:
+            future = self.write_queue.submit(delete_unused_tags)
+            try:
+                future.result(timeout=self.config.write_timeout)
+            except TimeoutError:
+                # The command is dropped if the writer has not started it yet,
+                # otherwise it finishes in the background
+                future.cancel()
+                raise SkipTask()
+        else:
+            delete_unused_tags(self._con, self._con.cursor())
+
+
+_schedulers: dict[str, MaintenanceScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_maintenance_scheduler(notebook: str) -> MaintenanceScheduler:
+    """
+    Return the running scheduler of `notebook`, starting it on first use.
+    Every notebook is maintained separately, next to its own write queue.
+    """
+    with _schedulers_lock:
+        if notebook not in _schedulers:
+            scheduler = MaintenanceScheduler(
+                path_to_db=get_notebook_path(notebook),
+                write_queue=get_write_queue(notebook),
+            )
+            scheduler.start()
+            _schedulers[notebook] = scheduler
+        return _schedulers[notebook]
@@ -0,0 +1,43 @@
+"""
+Upgrade an existing database in place.
+
+Usage: uv run python -m notetime.migrate [--notebook NAME] [--compress] [--threshold N] [--codec C]
+"""
+
+import argparse
+import sqlite3
+
+from notetime.compression import CODECS
+from notetime.db import (
+    DEFAULT_NOTEBOOK,
+    COMPRESSION_CODEC,
+    COMPRESSION_THRESHOLD,
+    compress_existing_notes,
+    get_notebook_path,
+    initialize_database,
+)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--notebook", default=DEFAULT_NOTEBOOK)
+    parser.add_argument(
+        "--compress",
+        action="store_true",
+        help="compress the texts of existing notes above the threshold",
+    )
+    parser.add_argument("--threshold", type=int, default=COMPRESSION_THRESHOLD)
+    parser.add_argument("--codec", choices=CODECS, default=COMPRESSION_CODEC)
+    args = parser.parse_args()
+
+    con = sqlite3.connect(get_notebook_path(args.notebook), timeout=30)
+    cur = con.cursor()
+    initialize_database(con, cur)
+
+    if args.compress:
+        num_compressed = compress_existing_notes(
+            con, cur, threshold=args.threshold, codec=args.codec
+        )
+        print(f"Compressed {num_compressed} notes")
+
+    con.close()
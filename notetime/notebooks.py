@@ -0,0 +1,256 @@
+"""
+Queries over several notebooks at once. The notebook databases are attached
+read-only to an in-memory connection, at most `MAX_ATTACHED_NOTEBOOKS` at a
+time, and the results of all notebooks are merged.
+
+Usage: uv run python -m notetime.notebooks NAME  (creates a new notebook)
+"""
+
+import argparse
+import sqlite3
+from collections.abc import Iterator
+from pathlib import Path
+
+from notetime.db import (
+    DATA_DIR,
+    Note,
+    Tag,
+    create_notebook,
+    get_notebook_path,
+    get_title_candidates_query,
+    list_notebooks,
+)
+from notetime.search import get_trigrams, rank_candidates
+
+# Default compile time limit of SQLite on the number of attached databases
+MAX_ATTACHED_NOTEBOOKS = 10
+
+
+def attach_notebooks(
+    cur: sqlite3.Cursor,
+    notebooks: list[str],
+    data_dir: Path = DATA_DIR,
+) -> dict[str, str]:
+    """
+    Attach `notebooks` read-only to the connection of `cur`, which must have
+    been opened with `uri=True`. Returns the schema name of every notebook.
+    """
+    schemas: dict[str, str] = {}
+    for i, notebook in enumerate(notebooks):
+        path = get_notebook_path(notebook, data_dir).resolve()
+        schema = f"notebook_{i}"
+        cur.execute(f"ATTACH DATABASE ? AS {schema}", (f"{path.as_uri()}?mode=ro",))
+        schemas[notebook] = schema
+    return schemas
+
+
+def detach_notebooks(cur: sqlite3.Cursor, schemas: dict[str, str]) -> None:
+    for schema in schemas.values():
+        cur.execute(f"DETACH DATABASE {schema}")
+
+
+def _attach_in_groups(
+    notebooks: list[str] | None,
+    data_dir: Path,
+) -> Iterator[tuple[sqlite3.Cursor, dict[str, str]]]:
+    if notebooks is None:
+        notebooks = list_notebooks(data_dir)
+
+    con = sqlite3.connect("file::memory:", uri=True)
+    cur = con.cursor()
+    try:
+        for start in range(0, len(notebooks), MAX_ATTACHED_NOTEBOOKS):
+            group = notebooks[start : start + MAX_ATTACHED_NOTEBOOKS]
+            schemas = attach_notebooks(cur, group, data_dir)
+            yield cur, schemas
+            detach_notebooks(cur, schemas)
+    finally:
+        con.close()
+
+
+def _get_note_from_row(row: tuple) -> Note:
+    return Note(
+        notebook=row[0],
+        id=row[1],
+        created_at=row[2],
+        updated_at=row[3],
+        title=row[4] or "",
+        text=row[5] or "",
+    )
+
+
+def get_all_notes_in_notebooks(
+    notebooks: list[str] | None = None,
+    data_dir: Path = DATA_DIR,
+) -> list[Note]:
+    notes: list[Note] = []
+    for cur, schemas in _attach_in_groups(notebooks, data_dir):
+        q = " UNION ALL ".join(
+            f"""
+            SELECT ?, id, created_at, updated_at, title, text
+            FROM {schema}.notes
+            WHERE id != 1
+            """
+            for schema in schemas.values()
+        )
+        cur.execute(q, list(schemas))
+        notes += [_get_note_from_row(row) for row in cur.fetchall()]
+
+    notes.sort(key=lambda note: note.updated_at, reverse=True)
+    return notes
+
+
+def get_notes_by_tags_in_notebooks(
+    tag_names: list[str],
+    notebooks: list[str] | None = None,
+    data_dir: Path = DATA_DIR,
+) -> list[Note]:
+    """
+    Notes with all of `tag_names` in any of `notebooks`, by default all
+    notebooks, most recently updated first.
+    """
+    notes: list[Note] = []
+    for cur, schemas in _attach_in_groups(notebooks, data_dir):
+        q = " UNION ALL ".join(
+            f"""
+            SELECT * FROM (
+                SELECT ?, n.id, n.created_at, n.updated_at, n.title, n.text
+                FROM {schema}.notes n
+                JOIN {schema}.note_tags nt ON n.id = nt.note_id
+                JOIN {schema}.tags t ON nt.tag_id = t.id
+                WHERE t.name IN ({",".join("?" for _ in tag_names)})
+                GROUP BY n.id
+                HAVING COUNT(DISTINCT t.id) = ?
+            )
+            """
+            for schema in schemas.values()
+        )
+        params: list[str | int] = []
+        for notebook in schemas:
+            params += [notebook, *tag_names, len(tag_names)]
+        cur.execute(q, params)
+        notes += [_get_note_from_row(row) for row in cur.fetchall()]
+
+    notes.sort(key=lambda note: note.updated_at, reverse=True)
+    return notes
+
+
+def search_notebooks(
+    query: str,
+    notebooks: list[str] | None = None,
+    limit: int = 20,
+    num_candidates: int = 50,
+    data_dir: Path = DATA_DIR,
+) -> list[Note]:
+    """
+    Find the notes with a title close to `query` in any of `notebooks`, by
+    default all notebooks. Every notebook contributes its own best
+    candidates, which are ranked together like in `search_notes`.
+    """
+    trigrams = list(get_trigrams(query))
+    if len(trigrams) == 0:
+        return []
+
+    # (distance, -num_shared_trigrams, note) of the best notes of each group
+    results: list[tuple[int, int, Note]] = []
+    for cur, schemas in _attach_in_groups(notebooks, data_dir):
+        queries: list[str] = []
+        params: list[str | int] = []
+        for notebook, schema in schemas.items():
+            candidates_query, candidates_params = get_title_candidates_query(
+                cur, trigrams, num_candidates, schema
+            )
+            queries.append(
+                f"""
+                SELECT ?, n.id, n.title, c.num_shared FROM ({candidates_query}) c
+                JOIN {schema}.notes n ON n.id = c.note_id
+                """
+            )
+            params += [notebook, *candidates_params]
+        q = " UNION ALL ".join(queries)
+        cur.execute(q, params)
+        candidates = cur.fetchall()
+
+        # Note ids are only unique within a notebook, so candidates are
+        # ranked by their position in the list instead
+        ranked = rank_candidates(
+            query,
+            [
+                (i, title, num_shared)
+                for i, (_, _, title, num_shared) in enumerate(candidates)
+            ],
+            limit=limit,
+        )
+        for i, distance in ranked:
+            notebook, note_id, _, num_shared = candidates[i]
+            cur.execute(
+                f"""
+                SELECT ?, id, created_at, updated_at, title, text
+                FROM {schemas[notebook]}.notes
+                WHERE id = ?
+                """,
+                (notebook, note_id),
+            )
+            row = cur.fetchone()
+            if row is not None:
+                results.append((distance, -num_shared, _get_note_from_row(row)))
+
+    results.sort(key=lambda result: result[:2])
+    return [note for _, _, note in results[:limit]]
+
+
+def search_tags_in_notebooks(
+    query: str,
+    notebooks: list[str] | None = None,
+    limit: int = 10,
+    num_candidates: int = 100,
+    data_dir: Path = DATA_DIR,
+) -> list[Tag]:
+    """
+    Find the tag names close to `query` in any of `notebooks`, by default all
+    notebooks, like `search_tags`. A name used in several notebooks is
+    returned once, without ids or note counts.
+    """
+    trigrams = list(get_trigrams(query))
+    if len(trigrams) == 0:
+        return []
+
+    # The most shared trigrams of every candidate name over all notebooks
+    candidates: dict[str, int] = {}
+    for cur, schemas in _attach_in_groups(notebooks, data_dir):
+        q = " UNION ALL ".join(
+            f"""
+            SELECT t.name, c.num_shared FROM (
+                SELECT tag_id, COUNT(*) AS num_shared FROM {schema}.tag_trigrams
+                WHERE trigram IN ({",".join("?" for _ in trigrams)})
+                GROUP BY tag_id
+                ORDER BY num_shared DESC
+                LIMIT ?
+            ) c
+            JOIN {schema}.tags t ON t.id = c.tag_id
+            """
+            for schema in schemas.values()
+        )
+        cur.execute(q, (trigrams + [num_candidates]) * len(schemas))
+        for name, num_shared in cur.fetchall():
+            candidates[name] = max(num_shared, candidates.get(name, 0))
+
+    names = list(candidates)
+    ranked = rank_candidates(
+        query,
+        [
+            (i, name, num_shared)
+            for i, (name, num_shared) in enumerate(candidates.items())
+        ],
+        limit=limit,
+    )
+    return [Tag(name=names[i]) for i, _ in ranked]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("name")
+    args = parser.parse_args()
+
+    path = create_notebook(args.name)
+    print(f"Created notebook {args.name} at {path}")
@@ -0,0 +1,405 @@
+"""
+Rebuild the data that is derived from the notes: the tags, the links between
+notes and tags, the trigram search indexes, the tag co-occurrence counts and
+the related notes.
+
+Usage: uv run python -m notetime.reindex [--notebook NAME] [--chunk-size N] [--max-workers N]
+"""
+
+import argparse
+import sqlite3
+import time
+from collections import Counter
+from concurrent.futures import Executor
+from datetime import datetime, timezone
+
+from pydantic import BaseModel
+
+from notetime.db import (
+    DEFAULT_NOTEBOOK,
+    REBUILD_PAUSE,
+    add_note_title_trigram_counts,
+    add_tag_cooccurrence,
+    create_index,
+    drop_table,
+    get_notebook_path,
+    join_title_and_text,
+    rebuild_related_notes,
+    set_needs_reindex,
+)
+from notetime.compression import decode_text
+from notetime.search import get_trigrams
+from notetime.tags import MIN_PARALLEL_SIZE, create_executor, extract_tags_batch
+
+
+CREATE_TAGS_REBUILD = """
+CREATE TABLE tags_rebuild (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL UNIQUE
+);
+"""
+
+CREATE_NOTE_TAGS_REBUILD = """
+CREATE TABLE note_tags_rebuild (
+    note_id INTEGER,
+    tag_id INTEGER,
+    PRIMARY KEY (note_id, tag_id),
+    FOREIGN KEY (note_id) REFERENCES notes(id) ON DELETE CASCADE,
+    FOREIGN KEY (tag_id) REFERENCES tags_rebuild(id) ON DELETE CASCADE
+);
+"""
+
+CREATE_NOTE_TITLE_TRIGRAMS_REBUILD = """
+CREATE TABLE note_title_trigrams_rebuild (
+    trigram TEXT NOT NULL,
+    note_id INTEGER NOT NULL,
+    PRIMARY KEY (trigram, note_id),
+    FOREIGN KEY (note_id) REFERENCES notes(id) ON DELETE CASCADE
+) WITHOUT ROWID;
+"""
+
+CREATE_NOTE_TITLE_TRIGRAM_COUNTS_REBUILD = """
+CREATE TABLE note_title_trigram_counts_rebuild (
+    trigram TEXT PRIMARY KEY,
+    num_notes INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+CREATE_TAG_TRIGRAMS_REBUILD = """
+CREATE TABLE tag_trigrams_rebuild (
+    trigram TEXT NOT NULL,
+    tag_id INTEGER NOT NULL,
+    PRIMARY KEY (trigram, tag_id),
+    FOREIGN KEY (tag_id) REFERENCES tags_rebuild(id) ON DELETE CASCADE
+) WITHOUT ROWID;
+"""
+
+CREATE_TAG_COOCCURRENCE_REBUILD = """
+CREATE TABLE tag_cooccurrence_rebuild (
+    tag_a INTEGER NOT NULL,
+    tag_b INTEGER NOT NULL,
+    num_notes INTEGER NOT NULL,
+    PRIMARY KEY (tag_a, tag_b),
+    FOREIGN KEY (tag_a) REFERENCES tags_rebuild(id) ON DELETE CASCADE,
+    FOREIGN KEY (tag_b) REFERENCES tags_rebuild(id) ON DELETE CASCADE
+) WITHOUT ROWID;
+"""
+
+# The notes with their full stored text, which is in `note_bodies` for
+# compressed notes
+SELECT_NOTES = """
+SELECT n.id, n.title, COALESCE(b.body, n.text), b.codec FROM notes n
+LEFT JOIN note_bodies b ON b.note_id = n.id
+"""
+
+# The rebuilt tables, with the tables that refer to `tags` before `tags`
+# itself, so that they can be dropped in this order
+REBUILT_TABLES = [
+    "note_tags",
+    "note_title_trigrams",
+    "note_title_trigram_counts",
+    "tag_trigrams",
+    "tag_cooccurrence",
+    "tags",
+]
+
+
+class RebuildReport(BaseModel):
+    num_notes: int = 0
+    num_caught_up_notes: int = 0
+    num_tags: int = 0
+    num_links: int = 0
+    extract_seconds: float = 0.0
+    write_seconds: float = 0.0
+    swap_seconds: float = 0.0
+    drop_seconds: float = 0.0
+    related_notes_seconds: float = 0.0
+    total_seconds: float = 0.0
+
+
+def _write_links(
+    cur: sqlite3.Cursor,
+    rows: list[tuple[int, str, str | bytes, str | None]],
+    executor: Executor | None,
+    report: RebuildReport,
+) -> None:
+    """
+    Write the tags and title trigrams of the notes in `rows` to the shadow
+    tables, and add them to the shadow co-occurrence and trigram counts.
+    """
+    start = time.perf_counter()
+    texts = [
+        join_title_and_text(title or "", decode_text(text, codec))
+        for _, title, text, codec in rows
+    ]
+    tags_per_note = extract_tags_batch(texts, max_workers=1, executor=executor)
+    report.extract_seconds += time.perf_counter() - start
+
+    start = time.perf_counter()
+    links = [
+        (note_id, tag)
+        for (note_id, _, _, _), tags in zip(rows, tags_per_note)
+        for tag in tags
+    ]
+    tags = list(dict.fromkeys(tag for _, tag in links))
+    cur.executemany(
+        "INSERT OR IGNORE INTO tags_rebuild (name) VALUES (?)",
+        [(tag,) for tag in tags],
+    )
+    cur.executemany(
+        """
+        INSERT OR IGNORE INTO tag_trigrams_rebuild (trigram, tag_id)
+        SELECT ?, id FROM tags_rebuild WHERE name = ?
+        """,
+        [(trigram, tag) for tag in tags for trigram in get_trigrams(tag)],
+    )
+    cur.executemany(
+        """
+        INSERT OR IGNORE INTO note_tags_rebuild (note_id, tag_id)
+        SELECT ?, id FROM tags_rebuild WHERE name = ?
+        """,
+        links,
+    )
+    add_tag_cooccurrence(
+        cur,
+        Counter(_get_tag_pairs(cur, [row[0] for row in rows])),
+        table="tag_cooccurrence_rebuild",
+    )
+
+    trigrams = [
+        (trigram, note_id)
+        for note_id, title, _, _ in rows
+        for trigram in get_trigrams(title or "")
+    ]
+    cur.executemany(
+        "INSERT INTO note_title_trigrams_rebuild (trigram, note_id) VALUES (?, ?)",
+        trigrams,
+    )
+    add_note_title_trigram_counts(
+        cur,
+        Counter(trigram for trigram, _ in trigrams),
+        table="note_title_trigram_counts_rebuild",
+    )
+    report.write_seconds += time.perf_counter() - start
+
+
+def _get_tag_pairs(cur: sqlite3.Cursor, note_ids: list[int]) -> list[tuple[int, int]]:
+    """
+    The pairs of tags of each of `note_ids` in the shadow tables, including
+    each tag paired with itself, as counted in `tag_cooccurrence`.
+    """
+    cur.execute(
+        f"""
+        SELECT a.tag_id, b.tag_id FROM note_tags_rebuild a
+        JOIN note_tags_rebuild b ON b.note_id = a.note_id
+        WHERE a.note_id IN ({",".join("?" for _ in note_ids)})
+        """,
+        note_ids,
+    )
+    return cur.fetchall()
+
+
+def _catch_up(
+    cur: sqlite3.Cursor,
+    changed_since: datetime,
+    report: RebuildReport,
+) -> None:
+    """
+    Process the notes that changed since `changed_since` again, by first
+    taking their old contributions out of the shadow tables.
+    """
+    cur.execute(f"{SELECT_NOTES} WHERE n.updated_at >= ?", (changed_since,))
+    rows = cur.fetchall()
+    report.num_caught_up_notes += len(rows)
+    if len(rows) == 0:
+        return
+
+    note_ids = [row[0] for row in rows]
+    note_ids_placeholders = ",".join("?" for _ in note_ids)
+    old_pairs = _get_tag_pairs(cur, note_ids)
+    add_tag_cooccurrence(
+        cur,
+        Counter({pair: -count for pair, count in Counter(old_pairs).items()}),
+        table="tag_cooccurrence_rebuild",
+    )
+    cur.execute(
+        f"""
+        SELECT trigram FROM note_title_trigrams_rebuild
+        WHERE note_id IN ({note_ids_placeholders})
+        """,
+        note_ids,
+    )
+    old_trigrams = Counter(row[0] for row in cur.fetchall())
+    add_note_title_trigram_counts(
+        cur,
+        Counter({trigram: -count for trigram, count in old_trigrams.items()}),
+        table="note_title_trigram_counts_rebuild",
+    )
+    for table in ["note_tags_rebuild", "note_title_trigrams_rebuild"]:
+        cur.execute(
+            f"DELETE FROM {table} WHERE note_id IN ({note_ids_placeholders})",
+            note_ids,
+        )
+
+    _write_links(cur, rows, executor=None, report=report)
+
+    # Tags that the changed notes no longer have may be on no note at all
+    old_tag_ids = list({a for a, _ in old_pairs})
+    cur.execute(
+        f"""
+        SELECT id FROM tags_rebuild
+        WHERE id IN ({",".join("?" for _ in old_tag_ids)})
+        AND NOT EXISTS (SELECT 1 FROM note_tags_rebuild WHERE tag_id = id)
+        """,
+        old_tag_ids,
+    )
+    orphaned_tag_ids = [(row[0],) for row in cur.fetchall()]
+    cur.executemany(
+        "DELETE FROM tag_trigrams_rebuild WHERE tag_id = ?", orphaned_tag_ids
+    )
+    cur.executemany("DELETE FROM tags_rebuild WHERE id = ?", orphaned_tag_ids)
+
+
+def rebuild_derived_data(
+    con: sqlite3.Connection,
+    cur: sqlite3.Cursor,
+    chunk_size: int = 1000,
+    max_workers: int | None = None,
+) -> RebuildReport:
+    """
+    Rebuild `tags`, `note_tags`, the trigram indexes, the tag co-occurrence
+    counts and the related notes from the notes, while the app keeps
+    running. All of it is written to shadow tables in chunks, each in its
+    own short transaction followed by a pause. Notes that were changed in
+    the meantime are processed again, once before and once while holding
+    the write lock for the swap, which otherwise only renames tables. The
+    old tables are dropped afterwards, one index at a time. Clears the flag
+    that the database needs a reindex once done.
+    """
+    report = RebuildReport()
+    total_start = time.perf_counter()
+    rebuild_started_at = datetime.now(timezone.utc)
+
+    # Left behind by a rebuild that did not finish
+    for table in REBUILT_TABLES:
+        drop_table(con, cur, f"{table}_rebuild")
+        drop_table(con, cur, f"{table}_old")
+
+    cur.execute(CREATE_TAGS_REBUILD)
+    cur.execute(CREATE_NOTE_TAGS_REBUILD)
+    cur.execute(CREATE_NOTE_TITLE_TRIGRAMS_REBUILD)
+    cur.execute(CREATE_NOTE_TITLE_TRIGRAM_COUNTS_REBUILD)
+    cur.execute(CREATE_TAG_TRIGRAMS_REBUILD)
+    cur.execute(CREATE_TAG_COOCCURRENCE_REBUILD)
+    create_index(cur, "note_tags_tag_id", table="note_tags_rebuild")
+    create_index(
+        cur, "note_title_trigrams_note_id", table="note_title_trigrams_rebuild"
+    )
+    create_index(cur, "tag_trigrams_tag_id", table="tag_trigrams_rebuild")
+    con.commit()
+
+    # A single process pool for the whole rebuild, if the notes together are
+    # large enough to make up for starting it
+    cur.execute("""
+        SELECT COALESCE(SUM(length(n.title) + length(COALESCE(b.body, n.text))), 0)
+        FROM notes n
+        LEFT JOIN note_bodies b ON b.note_id = n.id
+    """)
+    executor = create_executor(cur.fetchone()[0], max_workers, MIN_PARALLEL_SIZE)
+    try:
+        last_note_id = 0
+        while True:
+            cur.execute(
+                f"{SELECT_NOTES} WHERE n.id > ? ORDER BY n.id LIMIT ?",
+                (last_note_id, chunk_size),
+            )
+            rows = cur.fetchall()
+            if len(rows) == 0:
+                break
+
+            _write_links(cur, rows, executor, report)
+            con.commit()
+            time.sleep(REBUILD_PAUSE)
+
+            report.num_notes += len(rows)
+            last_note_id = rows[-1][0]
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    caught_up_at = datetime.now(timezone.utc)
+    _catch_up(cur, rebuild_started_at, report)
+    con.commit()
+
+    # The tables are renamed below, so the foreign keys are only enforced
+    # again once the swap is done
+    cur.execute("PRAGMA foreign_keys")
+    foreign_keys = cur.fetchone()[0]
+    cur.execute("PRAGMA foreign_keys = OFF;")
+
+    swap_start = time.perf_counter()
+    cur.execute("BEGIN IMMEDIATE;")
+    try:
+        _catch_up(cur, caught_up_at, report)
+
+        # Renaming also points the foreign keys of the other tables at the
+        # new names
+        for table in REBUILT_TABLES:
+            cur.execute(f"ALTER TABLE {table} RENAME TO {table}_old")
+        for table in REBUILT_TABLES:
+            cur.execute(f"ALTER TABLE {table}_rebuild RENAME TO {table}")
+        con.commit()
+    except Exception:
+        con.rollback()
+        raise
+    finally:
+        cur.execute(f"PRAGMA foreign_keys = {'ON' if foreign_keys else 'OFF'};")
+    report.swap_seconds = time.perf_counter() - swap_start
+
+    drop_start = time.perf_counter()
+    for table in REBUILT_TABLES:
+        drop_table(con, cur, f"{table}_old")
+    report.drop_seconds = time.perf_counter() - drop_start
+
+    related_start = time.perf_counter()
+    rebuild_related_notes(con, cur)
+    report.related_notes_seconds = time.perf_counter() - related_start
+
+    set_needs_reindex(cur, False)
+    con.commit()
+
+    cur.execute("SELECT COUNT(*) FROM tags")
+    report.num_tags = cur.fetchone()[0]
+    cur.execute("SELECT COUNT(*) FROM note_tags")
+    report.num_links = cur.fetchone()[0]
+
+    report.total_seconds = time.perf_counter() - total_start
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--notebook", default=DEFAULT_NOTEBOOK)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--max-workers", type=int, default=None)
+    args = parser.parse_args()
+
+    con = sqlite3.connect(get_notebook_path(args.notebook), timeout=30)
+    cur = con.cursor()
+    report = rebuild_derived_data(
+        con,
+        cur,
+        chunk_size=args.chunk_size,
+        max_workers=args.max_workers,
+    )
+    con.close()
+
+    print(f"Rebuilt derived data for {report.num_notes} notes")
+    print(f"  notes changed during rebuild: {report.num_caught_up_notes}")
+    print(f"  tags: {report.num_tags}, links: {report.num_links}")
+    print(f"  extract tags: {report.extract_seconds:.2f} s")
+    print(f"  write shadow tables: {report.write_seconds:.2f} s")
+    print(f"  swap: {report.swap_seconds:.2f} s")
+    print(f"  drop old tables: {report.drop_seconds:.2f} s")
+    print(f"  related notes: {report.related_notes_seconds:.2f} s")
+    print(f"  total: {report.total_seconds:.2f} s")
@@ -0,0 +1,128 @@
+import heapq
+import re
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def get_trigrams(text: str) -> set[str]:
+    """
+    Return the trigrams of the lowercased words in `text`. Each word is padded
+    with a space on both sides, so that the start and end of words, and words
+    of one or two characters, also produce trigrams.
+    """
+    trigrams: set[str] = set()
+    for word in WORD_PATTERN.findall(text.lower()):
+        padded = f" {word} "
+        trigrams.update(padded[i : i + 3] for i in range(len(padded) - 2))
+    return trigrams
+
+
+def levenshtein(a: str, b: str, max_distance: int | None = None) -> int:
+    """
+    Edit distance between `a` and `b`, computed with the bit-parallel
+    algorithm of Myers, which handles a whole column of the distance matrix
+    per character. When the distance is larger than `max_distance`,
+    `max_distance + 1` is returned.
+    """
+    if len(a) < len(b):
+        a, b = b, a
+    if max_distance is not None and len(a) - len(b) > max_distance:
+        return max_distance + 1
+
+    distance = len(b)
+    if distance > 0:
+        char_masks: dict[str, int] = {}
+        for i, char in enumerate(b):
+            char_masks[char] = char_masks.get(char, 0) | (1 << i)
+
+        all_bits = (1 << len(b)) - 1
+        last_bit = 1 << (len(b) - 1)
+        positive_vertical = all_bits
+        negative_vertical = 0
+
+        for char in a:
+            equal = char_masks.get(char, 0)
+            x_vertical = equal | negative_vertical
+            x_horizontal = (
+                ((equal & positive_vertical) + positive_vertical) ^ positive_vertical
+            ) | equal
+            positive_horizontal = negative_vertical | ~(
+                x_horizontal | positive_vertical
+            )
+            negative_horizontal = positive_vertical & x_horizontal
+
+            if positive_horizontal & last_bit:
+                distance += 1
+            elif negative_horizontal & last_bit:
+                distance -= 1
+
+            positive_horizontal = (positive_horizontal << 1) | 1
+            negative_horizontal = negative_horizontal << 1
+            positive_vertical = (
+                negative_horizontal | ~(x_vertical | positive_horizontal)
+            ) & all_bits
+            negative_vertical = positive_horizontal & x_vertical & all_bits
+    else:
+        distance = len(a)
+
+    if max_distance is not None and distance > max_distance:
+        return max_distance + 1
+    return distance
+
+
+def match_distance(query: str, text: str, max_distance: int | None = None) -> int:
+    """
+    Edit distance between `query` and the closest run of words in `text` with
+    the same number of words as `query`, so that a short query is not
+    penalized for matching a long title.
+    """
+    query_words = WORD_PATTERN.findall(query.lower())
+    text_words = WORD_PATTERN.findall(text.lower())
+    if len(query_words) == 0 or len(text_words) <= len(query_words):
+        return levenshtein(" ".join(query_words), " ".join(text_words), max_distance)
+
+    query = " ".join(query_words)
+    best_distance: int | None = None
+    for i in range(len(text_words) - len(query_words) + 1):
+        window = " ".join(text_words[i : i + len(query_words)])
+        distance = levenshtein(query, window, max_distance)
+        if best_distance is None or distance < best_distance:
+            best_distance = distance
+            max_distance = distance
+    assert best_distance is not None
+    return best_distance
+
+
+def rank_candidates(
+    query: str,
+    candidates: list[tuple[int, str, int]],
+    limit: int,
+    max_distance: int | None = None,
+) -> list[tuple[int, int]]:
+    """
+    Rank `(id, text, num_shared_trigrams)` candidates by their edit distance
+    to `query`, breaking ties by the number of shared trigrams. Returns the
+    ids and distances of the best `limit` candidates. Candidates further
+    than `max_distance` away are dropped, by default a third of the length
+    of the query, with a minimum of two typos.
+    """
+    if max_distance is None:
+        max_distance = max(2, len(query) // 3)
+
+    # Max-heap of the best candidates so far. Once it is full, candidates
+    # only need to be compared up to the distance of the worst one in it.
+    best: list[tuple[int, int, int]] = []
+    for id, text, num_shared in candidates:
+        cutoff = -best[0][0] if len(best) == limit else max_distance
+        distance = match_distance(query, text, cutoff)
+        if distance > cutoff:
+            continue
+
+        item = (-distance, num_shared, -id)
+        if len(best) < limit:
+            heapq.heappush(best, item)
+        else:
+            heapq.heappushpop(best, item)
+
+    ranked = sorted((-distance, -num_shared, -id) for distance, num_shared, id in best)
+    return [(id, distance) for distance, _, id in ranked]
@@ -0,0 +1,9 @@
+"""
+The time at which the app started to be imported. This module only imports
+`time`, so that the app can import it before anything else and the startup
+report includes all of its imports.
+"""
+
+import time
+
+STARTED_AT = time.perf_counter()
@@ -0,0 +1,184 @@
+"""
+Startup of the app. Only bringing the schema of every notebook up to date has
+to finish before the pages are built and the first request can be served.
+Write queues, maintenance and the caches of the databases are warmed up in a
+background thread, which also reindexes the notebooks whose derived data is
+missing.
+
+Usage: uv run python -m notetime.startup  (reports the startup of the app)
+"""
+
+# Imported first, for when this module is run directly
+from notetime.started import STARTED_AT
+
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from pydantic import BaseModel, Field
+
+from notetime.db import (
+    DATA_DIR,
+    get_all_tags,
+    get_in_progress_note,
+    get_notebook_path,
+    initialize_database,
+    list_notebooks,
+    needs_reindex,
+)
+from notetime.maintenance import get_maintenance_scheduler
+from notetime.reindex import rebuild_derived_data
+
+logger = logging.getLogger(__name__)
+
+
+class StartupReport(BaseModel):
+    import_seconds: float = 0.0
+    schema_seconds: dict[str, float] = Field(default_factory=dict)
+    upgraded_notebooks: list[str] = Field(default_factory=list)
+    # Notebooks whose derived data is rebuilt during the warm-up. Until then,
+    # their notes can be read and written, but are missing from searches,
+    # tags and related notes.
+    reindex_notebooks: list[str] = Field(default_factory=list)
+    app_seconds: float = 0.0
+    # Only set once the warm-up in the background has finished
+    warm_up_seconds: float | None = None
+    reindex_seconds: dict[str, float] = Field(default_factory=dict)
+    warm_up_errors: dict[str, str] = Field(default_factory=dict)
+
+    @property
+    def ready_seconds(self) -> float:
+        """Time until the app can serve its first request."""
+        return (
+            self.import_seconds + sum(self.schema_seconds.values()) + self.app_seconds
+        )
+
+
+def ensure_schemas(report: StartupReport, data_dir: Path = DATA_DIR) -> None:
+    """
+    Create or upgrade the database of every notebook, including the default
+    notebook when it does not exist yet.
+    """
+    for notebook in list_notebooks(data_dir):
+        start = time.perf_counter()
+        path = get_notebook_path(notebook, data_dir)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        con = sqlite3.connect(path, timeout=30)
+        cur = con.cursor()
+        if initialize_database(con, cur):
+            report.upgraded_notebooks.append(notebook)
+        if needs_reindex(cur):
+            report.reindex_notebooks.append(notebook)
+        con.close()
+
+        report.schema_seconds[notebook] = time.perf_counter() - start
+
+
+def warm_up_notebook(notebook: str, data_dir: Path = DATA_DIR) -> None:
+    """
+    Read the pages that the first requests need, so that they are in the
+    cache of the operating system instead of on disk.
+    """
+    con = sqlite3.connect(get_notebook_path(notebook, data_dir), timeout=0)
+    cur = con.cursor()
+    get_in_progress_note(cur)
+    get_all_tags(cur)
+    cur.execute("SELECT COUNT(*) FROM note_title_trigrams")
+    cur.execute("SELECT COUNT(*) FROM tag_trigrams")
+    con.close()
+
+
+def reindex_notebook(
+    notebook: str,
+    report: StartupReport,
+    data_dir: Path = DATA_DIR,
+) -> None:
+    logger.warning("Reindexing notebook %s in the background", notebook)
+    start = time.perf_counter()
+    con = sqlite3.connect(get_notebook_path(notebook, data_dir), timeout=30)
+    # Tags are extracted in this thread, as a process pool does not belong
+    # in the background of the app
+    rebuild_derived_data(con, con.cursor(), max_workers=1)
+    con.close()
+    report.reindex_seconds[notebook] = time.perf_counter() - start
+
+
+def warm_up(
+    report: StartupReport,
+    data_dir: Path = DATA_DIR,
+    start_services: bool = True,
+) -> None:
+    """
+    Warm up every notebook, and reindex the notebooks that need it. With
+    `start_services`, the write queue and the maintenance scheduler of each
+    notebook are started as well, which are always those of the notebooks
+    in `DATA_DIR`.
+    """
+    start = time.perf_counter()
+    for notebook in list_notebooks(data_dir):
+        try:
+            if start_services:
+                get_maintenance_scheduler(notebook)
+            warm_up_notebook(notebook, data_dir)
+            if notebook in report.reindex_notebooks:
+                reindex_notebook(notebook, report, data_dir)
+        except Exception as e:
+            report.warm_up_errors[notebook] = str(e)
+    report.warm_up_seconds = time.perf_counter() - start
+
+    # Logged once everything is done, so that the report is complete
+    if len(report.warm_up_errors) > 0:
+        logger.warning("%s", format_report(report))
+    else:
+        logger.info("%s", format_report(report))
+
+
+def start_warm_up(
+    report: StartupReport,
+    data_dir: Path = DATA_DIR,
+    start_services: bool = True,
+) -> threading.Thread:
+    thread = threading.Thread(
+        target=warm_up,
+        args=(report, data_dir, start_services),
+        name="notetime-warm-up",
+        daemon=True,
+    )
+    thread.start()
+    return thread
+
+
+def run_startup(data_dir: Path = DATA_DIR) -> StartupReport:
+    report = StartupReport(import_seconds=time.perf_counter() - STARTED_AT)
+    ensure_schemas(report, data_dir)
+    return report
+
+
+def format_report(report: StartupReport) -> str:
+    lines = [
+        f"Ready to serve after {report.ready_seconds:.3f} s",
+        f"  imports: {report.import_seconds:.3f} s",
+    ]
+    for notebook, seconds in report.schema_seconds.items():
+        upgraded = " (updated)" if notebook in report.upgraded_notebooks else ""
+        if notebook in report.reindex_notebooks:
+            upgraded += " (needs reindex)"
+        lines.append(f"  schema of {notebook}: {seconds:.3f} s{upgraded}")
+    lines.append(f"  pages: {report.app_seconds:.3f} s")
+    if report.warm_up_seconds is not None:
+        lines.append(f"  warm-up in background: {report.warm_up_seconds:.3f} s")
+    for notebook, seconds in report.reindex_seconds.items():
+        lines.append(f"  reindex of {notebook} in background: {seconds:.3f} s")
+    for notebook, error in report.warm_up_errors.items():
+        lines.append(f"  warm-up of {notebook} failed: {error}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    from notetime import app
+
+    app.warm_up_thread.join()
+    print(format_report(app.startup_report))
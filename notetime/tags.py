@@ -1,7 +1,66 @@
+import os
 import re
+from concurrent.futures import Executor
+
+TAG_PATTERN = re.compile(r"@([a-zA-Z0-9_]+)")
+
+# Below this many characters in total, starting worker processes costs more
+# than extracting the tags in the current process.
+MIN_PARALLEL_SIZE = 4_000_000
 
 
 def extract_tags(text: str) -> list[str]:
-    tag_pattern = r"@([a-zA-Z0-9_]+)"
-    tags: list[str] = re.findall(tag_pattern, text)
-    return [tag.lower() for tag in tags]
+    """
+    Return the lowercased tags in `text`, without duplicates, in the order
+    in which they first appear.
+    """
+    return list(dict.fromkeys(map(str.lower, TAG_PATTERN.findall(text))))
+
+
+def create_executor(
+    total_size: int,
+    max_workers: int | None = None,
+    min_parallel_size: int = MIN_PARALLEL_SIZE,
+) -> Executor | None:
+    """
+    A process pool for extracting the tags of texts of `total_size`
+    characters in total, or `None` when they are too small to make up for
+    starting the workers or only one CPU is available. The caller shuts it
+    down.
+    """
+    num_workers = max_workers or os.cpu_count() or 1
+    if num_workers == 1 or total_size < min_parallel_size:
+        return None
+
+    # Imported here because multiprocessing is slow to import, and only the
+    # reindex of large databases gets this far
+    from concurrent.futures import ProcessPoolExecutor
+
+    return ProcessPoolExecutor(max_workers=num_workers)
+
+
+def extract_tags_batch(
+    texts: list[str],
+    max_workers: int | None = None,
+    min_parallel_size: int = MIN_PARALLEL_SIZE,
+    executor: Executor | None = None,
+) -> list[list[str]]:
+    """
+    Extract the tags of many texts at once. The work is spread over
+    `executor` when one is given, which lets callers that extract tags in
+    several batches start the workers only once. Otherwise, a process pool
+    is started for this batch alone when it is large enough.
+    """
+    if executor is None:
+        executor = create_executor(
+            sum(len(text) for text in texts), max_workers, min_parallel_size
+        )
+        if executor is None:
+            return [extract_tags(text) for text in texts]
+        with executor:
+            return extract_tags_batch(texts, executor=executor)
+
+    # A few large chunks per worker keep the pickling overhead low
+    num_workers = getattr(executor, "_max_workers", os.cpu_count() or 1)
+    chunksize = max(1, len(texts) // (num_workers * 4))
+    return list(executor.map(extract_tags, texts, chunksize=chunksize))
@@ -0,0 +1,201 @@
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Any, Callable
+
+from pydantic import BaseModel
+
+from notetime.db import PATH_TO_DB, DEFAULT_NOTEBOOK, get_notebook_path
+
+
+class GroupCommitConnection(sqlite3.Connection):
+    """
+    Connection used by the writer thread. While a batch is open, calls to
+    `commit` made by the functions in `notetime.db` are ignored, so that all
+    commands in the batch end up in a single transaction.
+    """
+
+    in_batch: bool = False
+
+    def commit(self) -> None:
+        if not self.in_batch:
+            super().commit()
+
+
+class WriteCommand:
+    def __init__(self, fn: Callable[..., Any], kwargs: dict[str, Any]) -> None:
+        self.fn = fn
+        self.kwargs = kwargs
+        self.future: Future = Future()
+
+
+class WriteQueueStats(BaseModel):
+    queue_depth: int = 0
+    max_queue_depth: int = 0
+    commands: int = 0
+    failed_commands: int = 0
+    rejected_commands: int = 0
+    batches: int = 0
+
+    @property
+    def average_batch_size(self) -> float:
+        if self.batches == 0:
+            return 0.0
+        return self.commands / self.batches
+
+
+class WriteQueue:
+    """
+    Serializes all mutations of a database through one dedicated writer
+    connection. Commands are callables that take `con` and `cur` keyword
+    arguments, like `create_note` and `update_note`. Commands that are queued
+    at the same time are committed together in one transaction.
+    """
+
+    def __init__(
+        self,
+        path_to_db: Path = PATH_TO_DB,
+        max_queue_size: int = 1000,
+        max_batch_size: int = 64,
+    ) -> None:
+        self.max_batch_size = max_batch_size
+        self._queue: queue.Queue[WriteCommand | None] = queue.Queue(
+            maxsize=max_queue_size
+        )
+        self._stats = WriteQueueStats()
+        self._stats_lock = threading.Lock()
+
+        self._con = sqlite3.connect(
+            path_to_db,
+            check_same_thread=False,
+            isolation_level=None,
+            factory=GroupCommitConnection,
+        )
+        self._con.execute("PRAGMA foreign_keys = ON;")
+        self._con.execute("PRAGMA journal_mode = WAL;")
+        self._con.execute("PRAGMA synchronous = NORMAL;")
+
+        self._thread = threading.Thread(
+            target=self._run, name="notetime-writer", daemon=True
+        )
+        self._thread.start()
+
+    def submit(
+        self,
+        fn: Callable[..., Any],
+        timeout: float | None = None,
+        **kwargs: Any,
+    ) -> Future:
+        """
+        Queue `fn(con=..., cur=..., **kwargs)` for execution on the writer
+        connection. Blocks while the queue is full and raises `queue.Full`
+        if no slot became available within `timeout` seconds.
+        """
+        command = WriteCommand(fn=fn, kwargs=kwargs)
+        try:
+            self._queue.put(command, timeout=timeout)
+        except queue.Full:
+            with self._stats_lock:
+                self._stats.rejected_commands += 1
+            raise
+
+        with self._stats_lock:
+            self._stats.max_queue_depth = max(
+                self._stats.max_queue_depth, self._queue.qsize()
+            )
+        return command.future
+
+    def stats(self) -> WriteQueueStats:
+        with self._stats_lock:
+            stats = self._stats.model_copy()
+        stats.queue_depth = self._queue.qsize()
+        return stats
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join()
+        self._con.close()
+
+    def _run(self) -> None:
+        while True:
+            command = self._queue.get()
+            if command is None:
+                return
+
+            batch = [command]
+            stop = False
+            while len(batch) < self.max_batch_size:
+                try:
+                    command = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if command is None:
+                    stop = True
+                    break
+                batch.append(command)
+
+            self._execute_batch(batch)
+            if stop:
+                return
+
+    def _execute_batch(self, batch: list[WriteCommand]) -> None:
+        batch = [
+            command
+            for command in batch
+            if command.future.set_running_or_notify_cancel()
+        ]
+        if len(batch) == 0:
+            return
+
+        con = self._con
+        cur = con.cursor()
+        results: list[tuple[WriteCommand, Any, BaseException | None]] = []
+
+        try:
+            con.in_batch = True
+            cur.execute("BEGIN IMMEDIATE;")
+            for command in batch:
+                cur.execute("SAVEPOINT command;")
+                try:
+                    result = command.fn(con=con, cur=cur, **command.kwargs)
+                except Exception as e:
+                    cur.execute("ROLLBACK TO command;")
+                    cur.execute("RELEASE command;")
+                    results.append((command, None, e))
+                else:
+                    cur.execute("RELEASE command;")
+                    results.append((command, result, None))
+            con.in_batch = False
+            con.commit()
+        except Exception as e:
+            con.in_batch = False
+            if con.in_transaction:
+                con.rollback()
+            results = [(command, None, e) for command in batch]
+
+        num_failed = 0
+        for command, result, error in results:
+            if error is None:
+                command.future.set_result(result)
+            else:
+                num_failed += 1
+                command.future.set_exception(error)
+
+        with self._stats_lock:
+            self._stats.batches += 1
+            self._stats.commands += len(batch)
+            self._stats.failed_commands += num_failed
+
+
+# Every notebook is a separate database file with its own writer thread
+_write_queues: dict[str, WriteQueue] = {}
+_write_queues_lock = threading.Lock()
+
+
+def get_write_queue(notebook: str = DEFAULT_NOTEBOOK) -> WriteQueue:
+    with _write_queues_lock:
+        if notebook not in _write_queues:
+            _write_queues[notebook] = WriteQueue(path_to_db=get_notebook_path(notebook))
+        return _write_queues[notebook]
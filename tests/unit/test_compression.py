@@ -0,0 +1,34 @@
+from unittest import TestCase
+
+from notetime.compression import PREVIEW_LENGTH, decode_text, encode_text
+
+
+class TestCompression(TestCase):
+    def test_small_text_is_not_compressed(self):
+        stored_text, codec, preview = encode_text("short", threshold=100, codec="zlib")
+        self.assertEqual(stored_text, "short")
+        self.assertIsNone(codec)
+        self.assertIsNone(preview)
+        self.assertEqual(decode_text(stored_text, codec), "short")
+
+    def test_compression_disabled(self):
+        text = "a" * 1000
+        stored_text, codec, _ = encode_text(text, threshold=None, codec="zlib")
+        self.assertEqual(stored_text, text)
+        self.assertIsNone(codec)
+
+    def test_large_text_is_compressed(self):
+        text = "A line from a long log file.\n" * 1000
+        for codec in ["zlib", "lzma"]:
+            stored_text, stored_codec, preview = encode_text(
+                text, threshold=100, codec=codec
+            )
+            self.assertIsInstance(stored_text, bytes)
+            self.assertLess(len(stored_text), len(text))
+            self.assertEqual(stored_codec, codec)
+            self.assertEqual(preview, text[:PREVIEW_LENGTH])
+            self.assertEqual(decode_text(stored_text, stored_codec), text)
+
+    def test_unknown_codec(self):
+        with self.assertRaises(ValueError):
+            encode_text("a" * 1000, threshold=100, codec="unknown")
@@ -1,6 +1,10 @@
+import random
+import re
 from unittest import TestCase
+from unittest.mock import patch
 from pathlib import Path
 import sqlite3
+from datetime import datetime, timezone
 
 from notetime.db import (
     initialize_database,
@@ -9,7 +13,20 @@ from notetime.db import (
     get_note_by_id,
     get_all_tags,
     get_notes_by_tags,
+    search_notes,
+    search_tags,
+    get_cooccurring_tags,
+    get_related_notes,
+    get_note_titles,
+    rebuild_tag_cooccurrence,
+    rebuild_related_notes,
+    get_all_notes,
+    compress_existing_notes,
+    get_in_progress_note,
+    CREATE_RELATED_NOTES_REBUILD,
+    Note,
 )
+from notetime.compression import PREVIEW_LENGTH, encode_text
 
 
 class TestDB(TestCase):
@@ -30,7 +47,18 @@ class TestDB(TestCase):
 
         tables: set[str] = {row[0] for row in self.cur.fetchall()}
         tables = {table for table in tables if not table.startswith("sqlite_")}
-        expected_tables = {"notes", "tags", "note_tags"}
+        expected_tables = {
+            "notes",
+            "note_bodies",
+            "tags",
+            "note_tags",
+            "note_title_trigrams",
+            "note_title_trigram_counts",
+            "tag_trigrams",
+            "tag_cooccurrence",
+            "related_notes",
+            "metadata",
+        }
         self.assertEqual(tables, expected_tables)
 
     def test_create_note(self):
@@ -152,3 +180,386 @@ class TestDB(TestCase):
         )
         self.assertEqual(len(notes_with_third_and_second_tags), 1)
         self.assertEqual(notes_with_third_and_second_tags[0].id, note3.id)
+
+    def get_writes(self, note: Note) -> list[tuple[str, str]]:
+        """Update `note` and return the table and SQL of each write it made."""
+        statements: list[str] = []
+        self.con.set_trace_callback(statements.append)
+        try:
+            update_note(con=self.con, cur=self.cur, note=note)
+        finally:
+            self.con.set_trace_callback(None)
+
+        writes = []
+        for statement in statements:
+            statement = " ".join(statement.split())
+            match = re.match(
+                r"(?:INSERT(?: OR \w+)? INTO|DELETE FROM|UPDATE) (\w+)", statement
+            )
+            if match is not None:
+                writes.append((match.group(1), statement))
+        return writes
+
+    def test_update_note_keeps_tags_when_unchanged(self):
+        note = create_note(
+            con=self.con,
+            cur=self.cur,
+            text="Test note\nThis is a @test note.",
+        )
+        assert note.id is not None
+
+        note.text = "This is still a @test note, with more text."
+        written_tables = {table for table, _ in self.get_writes(note)}
+        self.assertEqual(
+            written_tables & {"tags", "note_tags", "tag_trigrams", "tag_cooccurrence"},
+            set(),
+        )
+
+    def test_update_note_writes_only_changed_tag_links(self):
+        note = create_note(
+            con=self.con,
+            cur=self.cur,
+            text="Test note\nThis is a @kept and @removed note.",
+        )
+        assert note.id is not None
+        tag_ids = {tag.name: tag.id for tag in get_all_tags(self.cur)}
+
+        note.text = "This is a @kept and @added note."
+        note_tags_writes = [
+            statement
+            for table, statement in self.get_writes(note)
+            if table == "note_tags"
+        ]
+        tag_ids |= {tag.name: tag.id for tag in get_all_tags(self.cur)}
+        self.assertEqual(len(note_tags_writes), 2)
+        self.assertTrue(note_tags_writes[0].startswith("INSERT"))
+        self.assertIn(f"({note.id}, {tag_ids['added']})", note_tags_writes[0])
+        self.assertTrue(note_tags_writes[1].startswith("DELETE"))
+        self.assertTrue(note_tags_writes[1].endswith(f"IN ({tag_ids['removed']})"))
+
+    def test_update_note_keeps_tags_used_by_other_notes(self):
+        note1 = create_note(
+            con=self.con,
+            cur=self.cur,
+            text="Test note 1\nThis is a @shared @first note.",
+        )
+        create_note(
+            con=self.con,
+            cur=self.cur,
+            text="Test note 2\nThis is a @shared note.",
+        )
+
+        note1.text = "This is a note without tags."
+        updated_note = update_note(con=self.con, cur=self.cur, note=note1)
+        self.assertEqual(updated_note.tags, [])
+
+        all_tags = set([tag.name for tag in get_all_tags(self.cur)])
+        self.assertEqual(all_tags, {"shared"})
+
+    def test_search_notes(self):
+        meeting_note = create_note(
+            con=self.con,
+            cur=self.cur,
+            text="Weekly meeting\nDiscussed the @roadmap.",
+        )
+        create_note(
+            con=self.con,
+            cur=self.cur,
+            text="Groceries\nMilk and eggs.",
+        )
+
+        notes = search_notes(self.cur, "meetnig")
+        self.assertEqual(notes[0].id, meeting_note.id)
+
+        assert meeting_note.id is not None
+        meeting_note.title = "Weekly standup"
+        update_note(con=self.con, cur=self.cur, note=meeting_note)
+
+        notes = search_notes(self.cur, "standpu")
+        self.assertEqual([note.id for note in notes], [meeting_note.id])
+
+        notes = search_notes(self.cur, "groceires")
+        self.assertEqual([note.title for note in notes][0], "Groceries")
+
+    def test_search_notes_with_frequent_trigrams(self):
+        for i in range(5):
+            create_note(con=self.con, cur=self.cur, text=f"Weekly meeting {i}")
+        review_note = create_note(con=self.con, cur=self.cur, text="Project review")
+        renamed_note = create_note(con=self.con, cur=self.cur, text="Weekly meeting")
+        assert renamed_note.id is not None
+        renamed_note.title = "Weekly retro"
+        update_note(con=self.con, cur=self.cur, note=renamed_note)
+
+        self.cur.execute("SELECT trigram, num_notes FROM note_title_trigram_counts")
+        counts = dict(self.cur.fetchall())
+        self.cur.execute("""
+            SELECT trigram, COUNT(*) FROM note_title_trigrams GROUP BY trigram
+        """)
+        self.assertEqual(counts, dict(self.cur.fetchall()))
+
+        # Only the two most recent notes with each frequent trigram are read
+        with patch("notetime.db.MAX_TRIGRAM_POSTINGS", 2):
+            notes = search_notes(self.cur, "weekly meetnig")
+            self.assertEqual(
+                [note.title for note in notes[:2]],
+                ["Weekly meeting 4", "Weekly meeting 3"],
+            )
+            self.assertNotIn("Weekly meeting 0", [note.title for note in notes])
+
+            notes = search_notes(self.cur, "project reveiw")
+            self.assertEqual(notes[0].id, review_note.id)
+
+    def test_search_tags(self):
+        note = create_note(
+            con=self.con,
+            cur=self.cur,
+            text="Test note\nAbout the @roadmap and @release.",
+        )
+
+        tags = search_tags(self.cur, "roadmpa")
+        self.assertEqual(tags[0].name, "roadmap")
+        self.assertEqual(tags[0].num_notes, 1)
+
+        note.text = "Only about the @release."
+        update_note(con=self.con, cur=self.cur, note=note)
+
+        tags = search_tags(self.cur, "roadmap")
+        self.assertNotIn("roadmap", [tag.name for tag in tags])
+
+    def test_tag_cooccurrence(self):
+        note = create_note(
+            con=self.con,
+            cur=self.cur,
+            text="Test note 1\nAbout @python and @sqlite.",
+        )
+        create_note(
+            con=self.con,
+            cur=self.cur,
+            text="Test note 2\nAbout @python, @sqlite and @testing.",
+        )
+
+        tags = get_cooccurring_tags(self.cur, ["python"])
+        self.assertEqual(
+            [(tag.name, tag.num_notes) for tag in tags], [("sqlite", 2), ("testing", 1)]
+        )
+
+        note.text = "About @python and @rust."
+        update_note(con=self.con, cur=self.cur, note=note)
+
+        tags = get_cooccurring_tags(self.cur, ["python"])
+        self.assertEqual(
+            [(tag.name, tag.num_notes) for tag in tags],
+            [("rust", 1), ("sqlite", 1), ("testing", 1)],
+        )
+
+        # The incrementally maintained counts match a full rebuild
+        self.cur.execute("SELECT * FROM tag_cooccurrence ORDER BY tag_a, tag_b")
+        incremental_counts = self.cur.fetchall()
+        rebuild_tag_cooccurrence(self.con, self.cur)
+        self.cur.execute("SELECT * FROM tag_cooccurrence ORDER BY tag_a, tag_b")
+        self.assertEqual(incremental_counts, self.cur.fetchall())
+
+    def test_related_notes(self):
+        note1 = create_note(
+            con=self.con, cur=self.cur, text="Note 1\nAbout @python and @sqlite."
+        )
+        note2 = create_note(
+            con=self.con, cur=self.cur, text="Note 2\nAbout @python and @sqlite."
+        )
+        note3 = create_note(con=self.con, cur=self.cur, text="Note 3\nAbout @python.")
+        note4 = create_note(con=self.con, cur=self.cur, text="Note 4\nAbout @rust.")
+        assert note1.id is not None and note3.id is not None
+
+        related = get_related_notes(self.cur, note1.id)
+        self.assertEqual([note.id for note in related], [note2.id, note3.id])
+
+        note3.text = "Now about @rust."
+        update_note(con=self.con, cur=self.cur, note=note3)
+
+        related = get_related_notes(self.cur, note1.id)
+        self.assertEqual([note.id for note in related], [note2.id])
+        related = get_related_notes(self.cur, note3.id)
+        self.assertEqual([note.id for note in related], [note4.id])
+
+        # The incrementally maintained scores match a full rebuild
+        self.cur.execute("SELECT * FROM related_notes ORDER BY 1, 2")
+        incremental_scores = self.cur.fetchall()
+        rebuild_related_notes(self.con, self.cur)
+        self.cur.execute("SELECT * FROM related_notes ORDER BY 1, 2")
+        rebuilt_scores = self.cur.fetchall()
+
+        self.assertEqual(incremental_scores, rebuilt_scores)
+
+    def test_get_note_titles(self):
+        note1 = create_note(con=self.con, cur=self.cur, text="Note 1\nFirst.")
+        note2 = create_note(con=self.con, cur=self.cur, text="Note 2\nSecond.")
+        assert note1.id is not None and note2.id is not None
+
+        notes = get_note_titles(self.cur, [note2.id, 999, note1.id])
+        self.assertEqual(
+            [(note.id, note.title) for note in notes],
+            [(note2.id, "Note 2"), (note1.id, "Note 1")],
+        )
+
+    def test_related_notes_match_rebuild(self):
+        rng = random.Random(0)
+        tag_names = [f"tag{i}" for i in range(8)]
+
+        def random_text() -> str:
+            tags = rng.sample(tag_names, rng.randint(0, 4))
+            return "Note\n" + " ".join(f"@{tag}" for tag in tags)
+
+        # A low limit lets tags cross it in both directions, and the many
+        # rebuilds do not need to leave room for other writers
+        with (
+            patch("notetime.db.MAX_RELATED_TAG_NOTES", 6),
+            patch("notetime.db.REBUILD_PAUSE", 0),
+        ):
+            notes = [get_in_progress_note(self.cur)]
+            for _ in range(20):
+                notes.append(
+                    create_note(con=self.con, cur=self.cur, text=random_text())
+                )
+
+            for _ in range(30):
+                note = rng.choice(notes)
+                note.title, note.text = random_text().split("\n")
+                update_note(con=self.con, cur=self.cur, note=note)
+
+                self.cur.execute("SELECT * FROM related_notes ORDER BY 1, 2")
+                incremental_scores = self.cur.fetchall()
+                rebuild_related_notes(self.con, self.cur, chunk_size=7)
+                self.cur.execute("SELECT * FROM related_notes ORDER BY 1, 2")
+                self.assertEqual(incremental_scores, self.cur.fetchall())
+
+    def test_update_related_notes_during_rebuild(self):
+        note1 = create_note(con=self.con, cur=self.cur, text="Note 1\n@python")
+        note2 = create_note(con=self.con, cur=self.cur, text="Note 2\n@rust")
+        assert note1.id is not None and note2.id is not None
+
+        # A rebuild that has not reached the notes yet
+        self.cur.execute(CREATE_RELATED_NOTES_REBUILD)
+        note2.text = "@python"
+        update_note(con=self.con, cur=self.cur, note=note2)
+
+        self.cur.execute(
+            "SELECT note_id, related_note_id FROM related_notes_rebuild ORDER BY 1"
+        )
+        self.assertEqual(
+            self.cur.fetchall(), [(note1.id, note2.id), (note2.id, note1.id)]
+        )
+
+    def test_large_note_is_compressed(self):
+        text = "A line from a long log file with a @log tag.\n" * 2000
+        note = create_note(
+            con=self.con,
+            cur=self.cur,
+            text=f"Server logs\n{text}",
+        )
+        assert note.id is not None
+
+        # Only the preview is stored in the notes table
+        self.cur.execute("SELECT text FROM notes WHERE id = ?", (note.id,))
+        self.assertEqual(self.cur.fetchone()[0], text[:PREVIEW_LENGTH])
+        self.cur.execute(
+            "SELECT codec, typeof(body) FROM note_bodies WHERE note_id = ?", (note.id,)
+        )
+        self.assertEqual(self.cur.fetchone(), ("zlib", "blob"))
+
+        retrieved_note = get_note_by_id(self.cur, note.id)
+        assert retrieved_note is not None
+        self.assertEqual(retrieved_note.text, text.rstrip("\n"))
+        self.assertEqual(retrieved_note.tags, ["log"])
+
+        listed_note = get_all_notes(self.cur)[0]
+        self.assertEqual(listed_note.text, retrieved_note.text[:PREVIEW_LENGTH])
+
+        retrieved_note.text = "Now a short note."
+        update_note(con=self.con, cur=self.cur, note=retrieved_note)
+        self.cur.execute("SELECT text FROM notes WHERE id = ?", (note.id,))
+        self.assertEqual(self.cur.fetchone()[0], "Now a short note.")
+        self.cur.execute("SELECT COUNT(*) FROM note_bodies")
+        self.assertEqual(self.cur.fetchone()[0], 0)
+
+    def test_compress_existing_notes(self):
+        text = "A line from a long log file.\n" * 2000
+        now = datetime.now(timezone.utc)
+        self.cur.execute(
+            "INSERT INTO notes (title, text, created_at, updated_at) VALUES (?, ?, ?, ?)",
+            ("Server logs", text, now, now),
+        )
+        self.con.commit()
+        note_id = self.cur.lastrowid
+        assert note_id is not None
+
+        num_compressed = compress_existing_notes(
+            self.con, self.cur, threshold=1024, codec="lzma"
+        )
+        self.assertEqual(num_compressed, 1)
+
+        self.cur.execute("SELECT codec FROM note_bodies WHERE note_id = ?", (note_id,))
+        self.assertEqual(self.cur.fetchone()[0], "lzma")
+
+        retrieved_note = get_note_by_id(self.cur, note_id)
+        assert retrieved_note is not None
+        self.assertEqual(retrieved_note.text, text)
+
+        num_compressed = compress_existing_notes(
+            self.con, self.cur, threshold=1024, codec="lzma"
+        )
+        self.assertEqual(num_compressed, 0)
+
+    def test_compress_existing_notes_keeps_concurrent_edits(self):
+        text = "A line from a long log file.\n" * 2000
+        note = create_note(con=self.con, cur=self.cur, text=f"Server logs\n{text}")
+        assert note.id is not None
+        self.cur.execute("UPDATE notes SET text = ? WHERE id = ?", (text, note.id))
+        self.cur.execute("DELETE FROM note_bodies WHERE note_id = ?", (note.id,))
+        self.con.commit()
+
+        def encode_and_edit(*args, **kwargs):
+            # The app saves the note while its old text is being compressed
+            self.cur.execute(
+                "UPDATE notes SET text = 'Edited' WHERE id = ?", (note.id,)
+            )
+            return encode_text(*args, **kwargs)
+
+        with patch("notetime.db.encode_text", encode_and_edit):
+            num_compressed = compress_existing_notes(self.con, self.cur, threshold=1024)
+        self.assertEqual(num_compressed, 0)
+
+        retrieved_note = get_note_by_id(self.cur, note.id)
+        assert retrieved_note is not None
+        self.assertEqual(retrieved_note.text, "Edited")
+
+    def test_initialize_database_moves_note_bodies(self):
+        # Before version 4, compressed texts were stored in the notes table
+        con = sqlite3.connect(":memory:")
+        cur = con.cursor()
+        cur.execute(
+            "CREATE TABLE notes (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "created_at TIMESTAMP, updated_at TIMESTAMP, title TEXT, text TEXT, "
+            "codec TEXT, preview TEXT)"
+        )
+        text = "A line from a long log file.\n" * 2000
+        stored_text, codec, preview = encode_text(text, threshold=1024, codec="zlib")
+        now = datetime.now(timezone.utc)
+        cur.execute(
+            "INSERT INTO notes (id, created_at, updated_at, title, text, codec, preview) "
+            "VALUES (2, ?, ?, 'Server logs', ?, ?, ?)",
+            (now, now, stored_text, codec, preview),
+        )
+        cur.execute("PRAGMA user_version = 3")
+        con.commit()
+
+        initialize_database(con, cur)
+
+        cur.execute("PRAGMA table_info(notes)")
+        columns = [row[1] for row in cur.fetchall()]
+        self.assertEqual(columns, ["id", "created_at", "updated_at", "title", "text"])
+
+        retrieved_note = get_note_by_id(cur, 2)
+        assert retrieved_note is not None
+        self.assertEqual(retrieved_note.text, text)
+        self.assertEqual(get_all_notes(cur)[0].text, text[:PREVIEW_LENGTH])
+        con.close()
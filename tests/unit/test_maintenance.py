@@ -0,0 +1,90 @@
+from unittest import TestCase
+from pathlib import Path
+import sqlite3
+import tempfile
+import time
+
+from notetime.db import initialize_database, get_all_tags
+from notetime.maintenance import MaintenanceConfig, MaintenanceScheduler
+from notetime.writer import WriteQueue
+
+
+class TestMaintenanceScheduler(TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = Path(self.tmp_dir.name) / "db.sqlite3"
+        self.con = sqlite3.connect(self.db_path)
+        self.cur = self.con.cursor()
+        initialize_database(self.con, self.cur)
+        self.scheduler = MaintenanceScheduler(
+            path_to_db=self.db_path,
+            config=MaintenanceConfig(optimize_interval=None),
+        )
+
+    def tearDown(self) -> None:
+        self.scheduler.stop()
+        self.con.close()
+        self.tmp_dir.cleanup()
+
+    def test_run_tasks(self):
+        self.cur.execute("INSERT INTO tags (name) VALUES ('unused')")
+        self.con.commit()
+
+        for name in ["optimize", "incremental_vacuum", "delete_unused_tags"]:
+            run = self.scheduler.run_task(name)
+            self.assertFalse(run.skipped, name)
+            self.assertIsNone(run.error, name)
+
+        self.assertEqual(get_all_tags(self.cur), [])
+        self.assertEqual(
+            set(self.scheduler.last_runs()),
+            {"optimize", "incremental_vacuum", "delete_unused_tags"},
+        )
+
+    def test_skip_when_database_is_locked(self):
+        self.cur.execute("INSERT INTO tags (name) VALUES ('unused')")
+        self.con.commit()
+
+        self.cur.execute("BEGIN IMMEDIATE;")
+        run = self.scheduler.run_task("delete_unused_tags")
+        self.con.rollback()
+
+        self.assertTrue(run.skipped)
+        self.assertIsNone(run.error)
+        self.assertEqual([tag.name for tag in get_all_tags(self.cur)], ["unused"])
+
+    def test_skip_when_write_queue_is_blocked(self):
+        write_queue = WriteQueue(path_to_db=self.db_path)
+        scheduler = MaintenanceScheduler(
+            path_to_db=self.db_path,
+            config=MaintenanceConfig(write_timeout=0.05),
+            write_queue=write_queue,
+        )
+
+        self.cur.execute("BEGIN IMMEDIATE;")
+        run = scheduler.run_task("delete_unused_tags")
+        self.con.rollback()
+
+        self.assertTrue(run.skipped)
+        self.assertIsNone(run.error)
+        self.assertLess(run.duration_seconds, 1)
+
+        scheduler.stop()
+        write_queue.close()
+
+    def test_start_and_stop(self):
+        scheduler = MaintenanceScheduler(
+            path_to_db=self.db_path,
+            config=MaintenanceConfig(
+                optimize_interval=0.01,
+                checkpoint_interval=None,
+                incremental_vacuum_interval=None,
+                unused_tags_interval=None,
+            ),
+        )
+        scheduler.start()
+        while "optimize" not in scheduler.last_runs():
+            time.sleep(0.01)
+        scheduler.stop()
+
+        self.assertIsNone(scheduler.last_runs()["optimize"].error)
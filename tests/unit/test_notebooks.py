@@ -0,0 +1,102 @@
+from unittest import TestCase
+from pathlib import Path
+import sqlite3
+import tempfile
+
+from notetime.db import (
+    DEFAULT_NOTEBOOK,
+    create_notebook,
+    create_note,
+    get_notebook_path,
+    list_notebooks,
+)
+from notetime.notebooks import (
+    MAX_ATTACHED_NOTEBOOKS,
+    get_all_notes_in_notebooks,
+    get_notes_by_tags_in_notebooks,
+    search_notebooks,
+    search_tags_in_notebooks,
+)
+
+
+class TestNotebooks(TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.data_dir = Path(self.tmp_dir.name)
+        create_notebook("work", self.data_dir)
+        create_notebook("home", self.data_dir)
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def add_note(self, notebook: str, text: str) -> None:
+        con = sqlite3.connect(get_notebook_path(notebook, self.data_dir))
+        create_note(con=con, cur=con.cursor(), text=text)
+        con.close()
+
+    def test_notebook_paths(self):
+        self.assertEqual(
+            get_notebook_path(DEFAULT_NOTEBOOK, self.data_dir),
+            self.data_dir / "db.sqlite3",
+        )
+        self.assertEqual(
+            get_notebook_path("work", self.data_dir),
+            self.data_dir / "notebooks" / "work.sqlite3",
+        )
+        for name in ["../work", "Work", "", "work.sqlite3"]:
+            with self.assertRaises(ValueError):
+                get_notebook_path(name, self.data_dir)
+
+        self.assertEqual(
+            list_notebooks(self.data_dir), [DEFAULT_NOTEBOOK, "home", "work"]
+        )
+        with self.assertRaises(ValueError):
+            create_notebook("work", self.data_dir)
+
+    def test_queries_across_notebooks(self):
+        self.add_note("work", "Meeting notes\nDiscussed the @roadmap.")
+        self.add_note("home", "Meeting the neighbours\nAbout the @roadmap works.")
+        self.add_note("home", "Groceries\nBuy milk.")
+
+        notes = search_notebooks(
+            "meeting", notebooks=["work", "home"], data_dir=self.data_dir
+        )
+        self.assertEqual(
+            [(note.notebook, note.title) for note in notes],
+            [("work", "Meeting notes"), ("home", "Meeting the neighbours")],
+        )
+
+        notes = get_notes_by_tags_in_notebooks(
+            ["roadmap"], notebooks=["work", "home"], data_dir=self.data_dir
+        )
+        self.assertEqual({note.notebook for note in notes}, {"work", "home"})
+        self.assertEqual(
+            [note.updated_at for note in notes],
+            sorted((note.updated_at for note in notes), reverse=True),
+        )
+
+        notes = get_all_notes_in_notebooks(
+            notebooks=["work", "home"], data_dir=self.data_dir
+        )
+        self.assertEqual(len(notes), 3)
+
+        tags = search_tags_in_notebooks(
+            "roadmpa", notebooks=["work", "home"], data_dir=self.data_dir
+        )
+        self.assertEqual([tag.name for tag in tags], ["roadmap"])
+
+    def test_more_notebooks_than_can_be_attached(self):
+        notebooks = [f"notebook-{i}" for i in range(MAX_ATTACHED_NOTEBOOKS + 2)]
+        for notebook in notebooks:
+            create_notebook(notebook, self.data_dir)
+            self.add_note(notebook, f"Shared title {notebook}\nWith a @shared tag.")
+
+        notes = get_notes_by_tags_in_notebooks(
+            ["shared"], notebooks=notebooks, data_dir=self.data_dir
+        )
+        self.assertEqual({note.notebook for note in notes}, set(notebooks))
+
+        notes = search_notebooks(
+            "shared title", notebooks=notebooks, limit=100, data_dir=self.data_dir
+        )
+        self.assertEqual(len(notes), len(notebooks))
@@ -0,0 +1,173 @@
+from unittest import TestCase
+from unittest.mock import patch
+from pathlib import Path
+import sqlite3
+
+from notetime.db import (
+    initialize_database,
+    create_note,
+    update_note,
+    get_note_by_id,
+    get_all_tags,
+    get_notes_by_tags,
+    search_notes,
+    search_tags,
+    count_note_title_trigrams,
+    rebuild_tag_cooccurrence,
+)
+from notetime.reindex import rebuild_derived_data
+from notetime.tags import extract_tags_batch
+
+
+class TestReindex(TestCase):
+    def setUp(self) -> None:
+        self.db_path = Path(":memory:")
+        self.con = sqlite3.connect(self.db_path)
+        self.cur = self.con.cursor()
+        initialize_database(self.con, self.cur)
+
+    def tearDown(self) -> None:
+        self.con.close()
+
+    def test_rebuild_derived_data(self):
+        note1 = create_note(
+            con=self.con,
+            cur=self.cur,
+            text="Test note 1\nThis is the @first note.",
+        )
+        note2 = create_note(
+            con=self.con,
+            cur=self.cur,
+            text="Test note 2\nThis is the @second note with a @first tag.",
+        )
+
+        # Simulate derived data that drifted from the notes
+        self.cur.execute("DELETE FROM note_tags WHERE note_id = ?", (note2.id,))
+        self.cur.execute("INSERT INTO tags (name) VALUES ('stale')")
+        self.con.commit()
+
+        report = rebuild_derived_data(self.con, self.cur, chunk_size=1)
+        self.assertEqual(report.num_notes, 3)
+        self.assertEqual(report.num_tags, 2)
+        self.assertEqual(report.num_links, 3)
+
+        all_tags = {tag.name: tag.num_notes for tag in get_all_tags(self.cur)}
+        self.assertEqual(all_tags, {"first": 2, "second": 1})
+
+        notes_with_second_tag = get_notes_by_tags(self.cur, ["second"])
+        self.assertEqual([note.id for note in notes_with_second_tag], [note2.id])
+
+        # Swapped in indexes keep the name they were created with
+        self.cur.execute("""
+            SELECT type, name FROM sqlite_master
+            WHERE type IN ('table', 'index') AND name NOT LIKE 'sqlite_%'
+        """)
+        schema_objects = {
+            name.removesuffix("_rebuild") if type_ == "index" else name
+            for type_, name in self.cur.fetchall()
+        }
+        self.assertEqual(
+            schema_objects,
+            {
+                "notes",
+                "note_bodies",
+                "tags",
+                "note_tags",
+                "note_tags_tag_id",
+                "note_title_trigrams",
+                "note_title_trigrams_note_id",
+                "note_title_trigram_counts",
+                "tag_trigrams",
+                "tag_trigrams_tag_id",
+                "tag_cooccurrence",
+                "related_notes",
+                "related_notes_related_note_id",
+                "metadata",
+            },
+        )
+
+        self.assertEqual(search_tags(self.cur, "secnod")[0].name, "second")
+        self.assertEqual(search_notes(self.cur, "tset note 2")[0].id, note2.id)
+
+        # Writes keep working on the swapped in tables
+        assert note1.id is not None
+        note1.text = "This is the @updated note."
+        update_note(con=self.con, cur=self.cur, note=note1)
+
+        retrieved_note = get_note_by_id(self.cur, note1.id)
+        assert retrieved_note is not None
+        self.assertEqual(retrieved_note.tags, ["updated"])
+
+        all_tags = {tag.name for tag in get_all_tags(self.cur)}
+        self.assertEqual(all_tags, {"first", "second", "updated"})
+
+    def get_derived_counts(self) -> tuple[list, list, list]:
+        # Tags get new ids with every rebuild, so they are compared by name
+        self.cur.execute("""
+            SELECT a.name, b.name, c.num_notes FROM tag_cooccurrence c
+            JOIN tags a ON a.id = c.tag_a
+            JOIN tags b ON b.id = c.tag_b
+            ORDER BY 1, 2
+        """)
+        cooccurrence = self.cur.fetchall()
+        self.cur.execute("SELECT * FROM note_title_trigram_counts ORDER BY 1")
+        trigram_counts = self.cur.fetchall()
+        self.cur.execute("""
+            SELECT t.name, tt.trigram FROM tag_trigrams tt
+            JOIN tags t ON t.id = tt.tag_id
+            ORDER BY 1, 2
+        """)
+        return cooccurrence, trigram_counts, self.cur.fetchall()
+
+    def test_rebuild_catches_up_with_changed_notes(self):
+        note1 = create_note(
+            con=self.con, cur=self.cur, text="Alpha\nAbout @first and @shared."
+        )
+        create_note(con=self.con, cur=self.cur, text="Beta\nAbout @shared.")
+        create_note(con=self.con, cur=self.cur, text="Gamma\nAbout @second.")
+        assert note1.id is not None
+
+        num_batches = 0
+
+        def extract_and_edit(*args, **kwargs):
+            # The first note is edited after its chunk was written
+            nonlocal num_batches
+            num_batches += 1
+            if num_batches == 3:
+                note1.text = "Now about @third and @shared."
+                note1.title = "Delta"
+                update_note(con=self.con, cur=self.cur, note=note1)
+            return extract_tags_batch(*args, **kwargs)
+
+        with patch("notetime.reindex.extract_tags_batch", extract_and_edit):
+            report = rebuild_derived_data(self.con, self.cur, chunk_size=1)
+        self.assertEqual(report.num_caught_up_notes, 1)
+
+        all_tags = {tag.name: tag.num_notes for tag in get_all_tags(self.cur)}
+        self.assertEqual(all_tags, {"shared": 2, "second": 1, "third": 1})
+        self.assertEqual(search_notes(self.cur, "delat")[0].id, note1.id)
+
+        # The counts built up chunk by chunk match those counted at once
+        counts = self.get_derived_counts()
+        rebuild_tag_cooccurrence(self.con, self.cur)
+        count_note_title_trigrams(self.cur)
+        self.assertEqual(counts, self.get_derived_counts())
+
+        # A second rebuild swaps the indexes back to their first names
+        rebuild_derived_data(self.con, self.cur)
+        self.assertEqual(counts, self.get_derived_counts())
+
+        self.cur.execute("SELECT name FROM sqlite_master WHERE type = 'index'")
+        self.assertIn("note_tags_tag_id", {row[0] for row in self.cur.fetchall()})
+
+    def test_rebuild_reads_compressed_notes(self):
+        # The tag is only in the compressed body, after the preview
+        text = "A line from a long log file.\n" * 3000 + "Tagged @logs."
+        note = create_note(con=self.con, cur=self.cur, text=f"Server logs\n{text}")
+        self.cur.execute("SELECT COUNT(*) FROM note_bodies")
+        self.assertEqual(self.cur.fetchone()[0], 1)
+
+        rebuild_derived_data(self.con, self.cur)
+
+        notes_with_tag = get_notes_by_tags(self.cur, ["logs"])
+        self.assertEqual([n.id for n in notes_with_tag], [note.id])
@@ -0,0 +1,37 @@
+from unittest import TestCase
+
+from notetime.search import get_trigrams, levenshtein, match_distance, rank_candidates
+
+
+class TestSearch(TestCase):
+    def test_get_trigrams(self):
+        self.assertEqual(get_trigrams("Abc"), {" ab", "abc", "bc "})
+        self.assertEqual(get_trigrams("a, a!"), {" a "})
+        self.assertEqual(get_trigrams(""), set())
+
+    def test_levenshtein(self):
+        self.assertEqual(levenshtein("meeting", "meeting"), 0)
+        self.assertEqual(levenshtein("meetng", "meeting"), 1)
+        self.assertEqual(levenshtein("kitten", "sitting"), 3)
+        self.assertEqual(levenshtein("", "abc"), 3)
+        self.assertEqual(levenshtein("abc", ""), 3)
+        self.assertEqual(levenshtein("flaw", "lawn"), 2)
+
+    def test_levenshtein_with_max_distance(self):
+        self.assertEqual(levenshtein("kitten", "sitting", max_distance=3), 3)
+        self.assertEqual(levenshtein("kitten", "sitting", max_distance=2), 3)
+        self.assertEqual(levenshtein("a", "abcdef", max_distance=2), 3)
+
+    def test_match_distance(self):
+        self.assertEqual(match_distance("metting", "Weekly team meeting notes"), 1)
+        self.assertEqual(match_distance("team meting", "Weekly team meeting"), 1)
+        self.assertEqual(match_distance("groceries", "Groceries"), 0)
+
+    def test_rank_candidates(self):
+        candidates = [
+            (1, "Meeting notes", 5),
+            (2, "Melting point", 3),
+            (3, "Greeting cards", 6),
+        ]
+        ranked = rank_candidates("meetng", candidates, limit=2)
+        self.assertEqual(ranked, [(1, 1), (2, 2)])
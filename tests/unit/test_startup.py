@@ -0,0 +1,141 @@
+from unittest import TestCase
+from pathlib import Path
+import sqlite3
+import tempfile
+
+from notetime.db import (
+    SCHEMA_VERSION,
+    create_note,
+    create_notebook,
+    get_all_notes,
+    get_in_progress_note,
+    get_notebook_path,
+    initialize_database,
+    get_note_by_id,
+    get_notes_by_tags,
+    get_related_notes,
+    needs_reindex,
+    rebuild_tag_cooccurrence,
+    search_notes,
+    update_note,
+)
+from notetime.startup import StartupReport, ensure_schemas, start_warm_up
+
+
+class TestStartup(TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.data_dir = Path(self.tmp_dir.name)
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_ensure_schemas_keeps_notes(self):
+        report = StartupReport()
+        ensure_schemas(report, self.data_dir)
+        self.assertEqual(report.upgraded_notebooks, ["default"])
+
+        path = get_notebook_path(data_dir=self.data_dir)
+        con = sqlite3.connect(path)
+        cur = con.cursor()
+        create_note(con=con, cur=cur, text="Kept note\nSurvives a restart.")
+        con.close()
+
+        report = StartupReport()
+        ensure_schemas(report, self.data_dir)
+        self.assertEqual(report.upgraded_notebooks, [])
+        self.assertEqual(set(report.schema_seconds), {"default"})
+
+        con = sqlite3.connect(path)
+        cur = con.cursor()
+        self.assertEqual([note.title for note in get_all_notes(cur)], ["Kept note"])
+        self.assertEqual(get_in_progress_note(cur).id, 1)
+        con.close()
+
+    def create_old_database(self) -> sqlite3.Connection:
+        """
+        A database from before the schema version, without the compressed
+        note bodies and without any of the derived tables.
+        """
+        path = get_notebook_path(data_dir=self.data_dir)
+        con = sqlite3.connect(path)
+        cur = con.cursor()
+        cur.execute("""
+            CREATE TABLE notes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created_at TIMESTAMP NOT NULL,
+                updated_at TIMESTAMP NOT NULL,
+                title TEXT,
+                text TEXT
+            )
+        """)
+        cur.execute("""
+            INSERT INTO notes (id, created_at, updated_at, title, text)
+            VALUES (1, '2024-01-01', '2024-01-01', 'Draft', 'in progress'),
+                (2, '2024-01-01', '2024-01-01', 'Old note', 'About @python'),
+                (3, '2024-01-01', '2024-01-01', 'Other note', '@python @sqlite')
+        """)
+        con.commit()
+        return con
+
+    def test_upgrade_existing_database(self):
+        con = self.create_old_database()
+        cur = con.cursor()
+
+        self.assertTrue(initialize_database(con, cur))
+        self.assertFalse(initialize_database(con, cur))
+
+        cur.execute("PRAGMA user_version")
+        self.assertEqual(cur.fetchone()[0], SCHEMA_VERSION)
+        self.assertEqual(get_in_progress_note(cur).title, "Draft")
+        self.assertEqual(
+            [note.title for note in get_all_notes(cur)], ["Old note", "Other note"]
+        )
+        self.assertTrue(needs_reindex(cur))
+        con.close()
+
+    def test_search_after_upgrade(self):
+        self.create_old_database().close()
+        report = StartupReport()
+        ensure_schemas(report, self.data_dir)
+        self.assertEqual(report.reindex_notebooks, ["default"])
+
+        start_warm_up(report, self.data_dir, start_services=False).join()
+        self.assertEqual(report.warm_up_errors, {})
+        self.assertEqual(set(report.reindex_seconds), {"default"})
+
+        con = sqlite3.connect(get_notebook_path(data_dir=self.data_dir))
+        cur = con.cursor()
+        self.assertFalse(needs_reindex(cur))
+        self.assertEqual(search_notes(cur, "old nte")[0].id, 2)
+        self.assertEqual(
+            [note.id for note in get_notes_by_tags(cur, ["python"])], [2, 3]
+        )
+        self.assertEqual([note.id for note in get_related_notes(cur, 2)], [3])
+
+        # The counts that edits update incrementally start out complete
+        note = get_note_by_id(cur, 3)
+        assert note is not None
+        note.text = "@sqlite"
+        update_note(con=con, cur=cur, note=note)
+        cur.execute("SELECT * FROM tag_cooccurrence ORDER BY 1, 2")
+        incremental_counts = cur.fetchall()
+        rebuild_tag_cooccurrence(con, cur)
+        cur.execute("SELECT * FROM tag_cooccurrence ORDER BY 1, 2")
+        self.assertEqual(incremental_counts, cur.fetchall())
+        con.close()
+
+        report = StartupReport()
+        ensure_schemas(report, self.data_dir)
+        self.assertEqual(report.reindex_notebooks, [])
+
+    def test_warm_up(self):
+        create_notebook("work", self.data_dir)
+        report = StartupReport()
+        ensure_schemas(report, self.data_dir)
+
+        with self.assertLogs("notetime.startup", "INFO") as logs:
+            start_warm_up(report, self.data_dir, start_services=False).join()
+        self.assertIsNotNone(report.warm_up_seconds)
+        self.assertEqual(report.warm_up_errors, {})
+        self.assertIn("warm-up in background", logs.output[-1])
@@ -1,6 +1,6 @@
 from unittest import TestCase
 
-from notetime.tags import extract_tags
+from notetime.tags import create_executor, extract_tags, extract_tags_batch
 
 
 class TestTags(TestCase):
@@ -31,3 +31,29 @@ class TestTags(TestCase):
 
         tags = extract_tags(text)
         self.assertEqual(tags, expected_tags)
+
+    def test_extract_tags_removes_duplicates(self):
+        text = "A note about @tag2, @Tag1 and @tag2 again, and @TAG1."
+        expected_tags = ["tag2", "tag1"]
+
+        tags = extract_tags(text)
+        self.assertEqual(tags, expected_tags)
+
+    def test_extract_tags_batch(self):
+        texts = ["A note with @tag1.", "No tags here.", "@tag2 and @Tag1 and @tag2"]
+        expected_tags = [["tag1"], [], ["tag2", "tag1"]]
+
+        self.assertEqual(extract_tags_batch(texts), expected_tags)
+        self.assertEqual(
+            extract_tags_batch(texts, max_workers=2, min_parallel_size=0),
+            expected_tags,
+        )
+
+        self.assertIsNone(create_executor(len("".join(texts)), max_workers=2))
+        executor = create_executor(0, max_workers=2, min_parallel_size=0)
+        assert executor is not None
+        with executor:
+            for _ in range(2):
+                self.assertEqual(
+                    extract_tags_batch(texts, executor=executor), expected_tags
+                )
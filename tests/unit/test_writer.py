@@ -0,0 +1,78 @@
+from unittest import TestCase
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import sqlite3
+import tempfile
+
+from notetime.db import (
+    initialize_database,
+    create_note,
+    update_note,
+    get_note_by_id,
+    get_all_notes,
+)
+from notetime.writer import WriteQueue
+
+
+def failing_command(con: sqlite3.Connection, cur: sqlite3.Cursor) -> None:
+    cur.execute("INSERT INTO tags (name) VALUES ('rolled_back')")
+    raise ValueError("command failed")
+
+
+class TestWriteQueue(TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = Path(self.tmp_dir.name) / "db.sqlite3"
+        self.con = sqlite3.connect(self.db_path)
+        self.cur = self.con.cursor()
+        initialize_database(self.con, self.cur)
+        self.write_queue = WriteQueue(path_to_db=self.db_path)
+
+    def tearDown(self) -> None:
+        self.write_queue.close()
+        self.con.close()
+        self.tmp_dir.cleanup()
+
+    def test_submit_returns_result(self):
+        note = self.write_queue.submit(
+            create_note, text="Test note\nThis is a @test note."
+        ).result()
+        self.assertIsNotNone(note.id)
+        assert note.id is not None
+
+        note.text = "This is an @updated note."
+        updated_note = self.write_queue.submit(update_note, note=note).result()
+        self.assertEqual(updated_note.tags, ["updated"])
+
+        retrieved_note = get_note_by_id(self.cur, note.id)
+        assert retrieved_note is not None
+        self.assertEqual(retrieved_note.text, "This is an @updated note.")
+
+    def test_concurrent_submits(self):
+        def submit(i: int):
+            return self.write_queue.submit(
+                create_note, text=f"Note {i}\nWith @tag{i % 3}."
+            ).result()
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            notes = list(executor.map(submit, range(50)))
+
+        self.assertEqual(len({note.id for note in notes}), 50)
+        self.assertEqual(len(get_all_notes(self.cur)), 50)
+
+        stats = self.write_queue.stats()
+        self.assertEqual(stats.commands, 50)
+        self.assertEqual(stats.failed_commands, 0)
+        self.assertLessEqual(stats.batches, 50)
+
+    def test_failed_command_does_not_affect_batch(self):
+        failed = self.write_queue.submit(failing_command)
+        created = self.write_queue.submit(create_note, text="Kept note")
+
+        with self.assertRaises(ValueError):
+            failed.result()
+        self.assertIsNotNone(created.result().id)
+
+        self.cur.execute("SELECT COUNT(*) FROM tags WHERE name = 'rolled_back'")
+        self.assertEqual(self.cur.fetchone()[0], 0)
+        self.assertEqual(self.write_queue.stats().failed_commands, 1)